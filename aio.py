@@ -0,0 +1,59 @@
+from settings import JiraSettings, SlackSettings, AsyncSettings
+from threading import Lock, Thread
+import asyncio
+
+# One event loop in a background thread does all the async I/O for the process. Sync callers hand it
+# coroutines through run()/gather(), so many requests can be in flight without a thread each.
+
+_loop = None
+_sessions = {}
+_lock = Lock()
+
+
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, daemon=True).start()
+    return _loop
+
+
+def run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def gather(*coros):
+    """Runs all the coroutines at once, returns their results in order (exceptions included, not raised)"""
+    async def _all():
+        return await asyncio.gather(*coros, return_exceptions=True)
+    return run(_all())
+
+
+def _session(name, **kwargs):
+    # Only ever called on the loop, so no locking needed. One pooled session per upstream.
+    import aiohttp  # Only paid for when the async backend is actually used
+    if name not in _sessions:
+        _sessions[name] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=AsyncSettings.POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=AsyncSettings.TIMEOUT),
+            **kwargs)
+    return _sessions[name]
+
+
+async def jira_search(jql, start, max_results, fields):
+    import aiohttp
+    session = _session('jira', auth=aiohttp.BasicAuth(JiraSettings.USER or '', JiraSettings.TOKEN or ''))
+    payload = {'jql': jql, 'startAt': start, 'maxResults': max_results, 'fields': fields}
+
+    async with session.post(f'{JiraSettings.URL}rest/api/2/search', json=payload) as response:
+        response.raise_for_status()
+        return await response.json()
+
+
+async def slack_post(method, form):
+    """One Web API call, no retries (see Transport.request_async). Returns (status, headers, body)"""
+    session = _session('slack', headers={'Authorization': f'Bearer {SlackSettings.TOKEN}'})
+
+    async with session.post(f'{SlackSettings.API_URL}{method}', data=form) as response:
+        return response.status, dict(response.headers), await response.read()
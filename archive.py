@@ -0,0 +1,114 @@
+from settings import TZ, ArchiveSettings
+from datetime import datetime, timedelta
+import sqlite3
+import metrics
+import time
+
+
+class HandoverArchive():
+    """Every handover that went out, line item by line item, searchable without going back to Jira.
+
+    Line items live in a plain table (indexed by issue key and time) with an FTS5 index over their
+    summaries and section headings alongside, sharing rowids."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS handovers ('
+                'id INTEGER PRIMARY KEY, ticket TEXT NOT NULL, link TEXT, kind TEXT NOT NULL, '
+                'created_at REAL NOT NULL)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS handover_items ('
+                'id INTEGER PRIMARY KEY, handover_id INTEGER NOT NULL REFERENCES handovers (id), '
+                'section TEXT, heading TEXT, issue_key TEXT, summary TEXT, link TEXT, created_at REAL NOT NULL)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS handover_items_by_key '
+                'ON handover_items (issue_key COLLATE NOCASE, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS handover_items_by_time ON handover_items (created_at)')
+            conn.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS handover_text USING fts5('
+                'summary, heading, content=handover_items, content_rowid=id)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def record(self, ticket, secs, kind='new'):
+        """Saves what a handover ticket showed, kind is "new" or "update". Returns the handover's id"""
+        now = time.time()
+        with self._connect() as conn:
+            handover_id = conn.execute(
+                'INSERT INTO handovers (ticket, link, kind, created_at) VALUES (?, ?, ?, ?)',
+                (ticket.key, ticket.permalink(), kind, now)).lastrowid
+
+            for section in secs:
+                for li in section.line_items:
+                    item_id = conn.execute(
+                        'INSERT INTO handover_items '
+                        '(handover_id, section, heading, issue_key, summary, link, created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (handover_id, section.name, section.heading, li.key, li.summary, li.link, now)).lastrowid
+                    conn.execute(
+                        'INSERT INTO handover_text (rowid, summary, heading) VALUES (?, ?, ?)',
+                        (item_id, li.summary, section.heading))
+
+        return handover_id
+
+    def search(self, key=None, text=None, since=None, until=None, limit=None):
+        """Line items that went out in a handover, newest first. Any combination of filters can be given.
+
+        key is an exact issue key (or channel name), text is matched word by word against summaries and
+        headings, since and until are epoch seconds."""
+        limit = limit or ArchiveSettings.MAX_RESULTS
+
+        query = (
+            'SELECT h.ticket, h.link, h.kind, i.created_at, i.section, i.heading, i.issue_key, i.summary, i.link '
+            'FROM handover_items i JOIN handovers h ON h.id = i.handover_id')
+        where = []
+        params = []
+
+        words = (text or '').split()
+        if words:  # An empty MATCH is a syntax error, whitespace alone just doesn't filter
+            query += ' JOIN handover_text t ON t.rowid = i.id'
+            where.append('handover_text MATCH ?')
+            params.append(_match_expr(words))
+        if key and key.strip():
+            where.append('i.issue_key = ? COLLATE NOCASE')
+            params.append(key.strip())
+        if since is not None:
+            where.append('i.created_at >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('i.created_at < ?')
+            params.append(until)
+
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY i.created_at DESC LIMIT ?'
+
+        with metrics.timer('archive_search_seconds'), self._connect() as conn:
+            rows = conn.execute(query, params + [limit]).fetchall()
+
+        keys = ('ticket', 'ticket_link', 'kind', 'at', 'section', 'heading', 'key', 'summary', 'link')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def last_seen(self, key):
+        """When (and in which handover) an issue last showed up, None if it never did"""
+        found = self.search(key=key, limit=1)
+        return found[0] if found else None
+
+
+def _match_expr(words):
+    # Every word quoted, so whatever the user typed can't be read as FTS5 syntax (and all words must match)
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def day_range(start=None, end=None):
+    """Epoch bounds for whole local days given as YYYY-MM-DD (either end can be left open)"""
+    since = TZ.localize(datetime.strptime(start, '%Y-%m-%d')).timestamp() if start else None
+    until = TZ.localize(datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).timestamp() if end else None
+    return since, until
+
+
+archive = HandoverArchive(ArchiveSettings.PATH)
@@ -0,0 +1,39 @@
+"""Micro-benchmark for the Slack block/message builder on very large sections.
+
+Run from the repo root: python bench/bench_blocks.py [incidents]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slack_interface  # noqa: E402
+
+
+def fake_section(incidents):
+    lines = ['*Outstanding Incidents ({}):*'.format(incidents), '']
+    for i in range(incidents):
+        lines.append(f'<https://birdco.atlassian.net/browse/NOC-{i}|*NOC-{i} — P3 — Last update: 2020-02-02_10:00*>')
+        lines.append('Scooters in some market are reporting as offline in batches, investigating with vendor '[:85])
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    incidents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    section = fake_section(incidents)
+    runs = 20
+
+    build = timeit.timeit(lambda: slack_interface.msg_builder(section, section), number=runs) / runs
+    blocks = slack_interface.msg_builder(section, section)
+    pages = slack_interface.paginate(blocks)
+
+    print(f'{incidents} incidents x2 segments, {len(section) * 2} chars')
+    print(f'msg_builder: {build * 1000:.2f} ms, {len(blocks)} blocks, {len(pages)} messages')
+    assert all(len(b['text']['text']) <= slack_interface.MAX_BLOCK_CHARS for b in blocks if b['type'] == 'section')
+    assert all(len(p) <= slack_interface.MAX_MSG_BLOCKS for p in pages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""End-to-end latency of the scheduled jobs and the on-demand view, against the local fakes in bench/fakes.py.
+
+Every run starts cold (empty Jira cache, no snapshots). Results are appended to bench/results.jsonl together
+with the current commit, so speed changes show up between changes.
+
+Run from the repo root: python bench/bench_e2e.py --latency 0.2 --issues 500 --runs 3
+"""
+from tempfile import mkdtemp
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import fakes  # noqa: E402
+
+
+def _configure(base_url):
+    # Has to happen before any of the bot's modules are imported, settings are read at import time
+    tmp = mkdtemp(prefix='noc-news-bench-')
+    os.environ.update({
+        'JIRA_URL': base_url,
+        'JIRA_USER': 'bench',
+        'JIRA_TOKEN': 'bench',
+        'SLACK_API_URL': f'{base_url}api/',
+        'SLACK_TOKEN': 'bench',
+        'HANDOVER_WHOOK': f'{base_url}webhook',
+        'SLACK_SIGN_SECRET': 'bench',
+        'NOC_NEWS_STATE': os.path.join(tmp, 'state.db'),
+        'CHANNEL_INDEX': os.path.join(tmp, 'channel_index.json'),
+    })
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds added to every fake response')
+    parser.add_argument('--issues', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=40)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join(HERE, 'results.jsonl'))
+    args = parser.parse_args()
+
+    server, base_url = fakes.serve(latency=args.latency, issues=args.issues, channels=args.channels)
+    _configure(base_url)
+
+    import jira_interface
+    import noc_status
+    import metrics
+    import jobs
+    from settings import COMPONENTS
+    from state import store
+
+    def cold():
+        jira_interface.cache.invalidate()
+        for name in COMPONENTS:
+            store.delete(f'snapshot:{name}')
+
+    first_content = []  # Seconds into the final_view scenario the first section showed up in the view
+
+    def final_view():
+        started = time.perf_counter()
+        shown = []
+
+        def progress(blocks):
+            shown.append(time.perf_counter() - started)
+            noc_status.final_view('V0', blocks)
+
+        noc_status.final_view('V0', noc_status.render_blocks('full_ho', progress))
+        first_content.append(shown[0] if shown else time.perf_counter() - started)
+
+    scenarios = {
+        'new_handover': lambda: jobs.new_handover('Bench'),
+        'followup_reminder': jobs.followup_reminder,
+        'final_view': final_view,
+    }
+
+    results = {}
+    for name, scenario in scenarios.items():
+        timings = []
+        before = metrics.snapshot()[0]
+        for _ in range(args.runs):
+            cold()
+            fakes.FakeHandler.counts = {}
+            started = time.perf_counter()
+            scenario()
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            'best': round(min(timings), 3),
+            'mean': round(sum(timings) / len(timings), 3),
+            'requests': sum(fakes.FakeHandler.counts.values()),  # Of the last run
+            # Sections that became placeholders, a run full of them is timing error pages rather than searches
+            'failures': sum(v - before.get(k, 0) for k, v in metrics.snapshot()[0].items()
+                            if k[0] == 'section_failures_total'),
+        }
+        print(f'{name:>18}: best {results[name]["best"]:.3f}s, mean {results[name]["mean"]:.3f}s, '
+              f'{results[name]["requests"]} requests, {results[name]["failures"]} failed sections')
+
+    results['final_view']['first_content'] = round(min(first_content), 3)
+    print(f'{"first content":>18}: best {results["final_view"]["first_content"]:.3f}s')
+
+    record = {
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _commit(),
+        'latency': args.latency,
+        'issues': args.issues,
+        'channels': args.channels,
+        'runs': args.runs,
+        'results': results,
+    }
+    with open(args.out, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
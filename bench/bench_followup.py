@@ -0,0 +1,59 @@
+"""Benchmark for SLA follow-up evaluation against thousands of open incidents.
+
+Compares followup.evaluate against the old per-issue strptime approach.
+Run from the repo root: python bench/bench_followup.py [issues]
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from settings import TZ, Intervals  # noqa: E402
+import followup  # noqa: E402
+
+
+def fake_issues(count):
+    now = datetime.now(TZ)
+    issues = []
+    for i in range(count):
+        updated = now - timedelta(seconds=random.randint(0, 2 * Intervals.P4))
+        issues.append(SimpleNamespace(key=f'NOC-{i}', fields=SimpleNamespace(
+            priority=SimpleNamespace(id=str(random.randint(1, 5))),
+            updated=updated.strftime('%Y-%m-%dT%H:%M:%S.000%z'))))
+    return issues
+
+
+def legacy(issues):
+    # What filter_followup used to do, kept here purely as a baseline
+    now = datetime.now(TZ)
+    out = []
+    for issue in issues:
+        p = int(issue.fields.priority.id)
+        age = (now - datetime.strptime(issue.fields.updated, '%Y-%m-%dT%H:%M:%S.%f%z')).total_seconds()
+        if p == 2 and age > Intervals.P2 or p == 3 and age > Intervals.P3 or p == 4 and age > Intervals.P4:
+            out.append(issue)
+    return out
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    issues = fake_issues(count)
+    runs = 10
+
+    assert {i.key for i in legacy(issues)} == {i.key for i in followup.filter_followup(issues)}
+
+    old = timeit.timeit(lambda: legacy(issues), number=runs) / runs
+    new = timeit.timeit(lambda: followup.evaluate(issues), number=runs) / runs
+    overdue, approaching = followup.evaluate(issues)
+
+    print(f'{count} issues: {len(overdue)} overdue, {len(approaching)} approaching')
+    print(f'legacy:   {old * 1000:.2f} ms')
+    print(f'evaluate: {new * 1000:.2f} ms ({old / new:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
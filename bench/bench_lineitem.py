@@ -0,0 +1,63 @@
+"""Memory and render time of large sections, compact LineItem vs the old kwargs-dict one.
+
+Run from the repo root: python bench/bench_lineitem.py [items]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from settings import COMPONENTS  # noqa: E402
+import sections  # noqa: E402
+
+FMT = COMPONENTS['outstanding_incidents']['kwargs']['line_fmt']
+
+
+class LegacyLineItem():
+    # What LineItem used to look like, kept here purely as a baseline
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def render(self, for_slack, max_len):
+        title = FMT.format(**self.fields)
+        if for_slack:
+            title = f'<{self.fields["link"]}|{title}>'
+        return title + '\n' + self.fields['summary'][:max_len] + '\n\n'
+
+
+def fields(i):
+    return dict(
+        key=f'NOC-{i}', priority=str(i % 5 + 1), created='2020-02-01', updated='2020-02-02_10:00',
+        summary=f'Scooters in market {i} are reporting as offline in batches, investigating with vendor',
+        link=f'https://birdco.atlassian.net/browse/NOC-{i}', parent_key=None, due='UNSET',
+        priority_id=i % 5 + 1, duedate='', updated_at='2020-02-02T10:00:00.000-0800')
+
+
+def measure(build):
+    tracemalloc.start()
+    items = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    runs = 20
+
+    legacy, legacy_mem = measure(lambda: [LegacyLineItem(**fields(i)) for i in range(count)])
+    compact, compact_mem = measure(lambda: [sections.LineItem(**fields(i)) for i in range(count)])
+    section = sections.Section('Outstanding Incidents', compact, FMT, show_count=True)
+
+    legacy_time = timeit.timeit(lambda: ''.join(li.render(True, 85) for li in legacy), number=runs) / runs
+    compact_time = timeit.timeit(lambda: section.get_section(for_slack=True), number=runs) / runs
+
+    print(f'{count} line items')
+    print(f'memory: legacy {legacy_mem / 1024:.0f} KiB, compact {compact_mem / 1024:.0f} KiB')
+    print(f'render: legacy {legacy_time * 1000:.2f} ms, compact {compact_time * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Local stand-ins for the Jira and Slack endpoints NOC News talks to, with configurable latency and data size.
+
+Jira:  /rest/api/2/serverInfo, /rest/api/2/field, /rest/api/2/search, /rest/api/2/project/<key>, /rest/api/2/issue[/<id>]
+Slack: /webhook, /api/views.open, /api/views.update, /api/channels.list
+
+Run standalone with: python bench/fakes.py --port 8765 --latency 0.2 --issues 500 --channels 40
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from threading import Thread
+import argparse
+import json
+import random
+import time
+
+
+# (name, subtask) pairs spread over the fake issues, enough for every query group member to find some
+_TYPES = [('Incident', False), ('Platform Partner Outage', False), ('Story', False), ('Change Record', False),
+          ('Sub-task', True)]
+_STATUSES = ['Open', 'In Progress', 'Closed', 'Done']
+
+
+class FakeData():
+    def __init__(self, base_url, issues=200, channels=20, seed=1):
+        rnd = random.Random(seed)
+        now = datetime.now().astimezone()
+        self.base_url = base_url
+
+        self.issues = []
+        for i in range(issues, 0, -1):
+            updated = now - timedelta(seconds=rnd.randint(0, 14 * 86400))
+            priority = rnd.randint(1, 5)
+            self.issues.append({
+                'id': str(10000 + i),
+                'key': f'NOC-{i}',
+                'self': f'{base_url}rest/api/2/issue/{10000 + i}',
+                'fields': {
+                    'priority': {'id': str(priority), 'name': str(priority)},
+                    'issuetype': dict(zip(('name', 'subtask'), rnd.choice(_TYPES))),
+                    'status': {'name': rnd.choice(_STATUSES)},
+                    'created': (updated - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S.000%z'),
+                    'updated': updated.strftime('%Y-%m-%dT%H:%M:%S.000%z'),
+                    'summary': f'Fake incident number {i}, scooters offline in some market',
+                    'duedate': (now + timedelta(days=rnd.randint(-2, 5))).strftime('%Y-%m-%d'),
+                    'parent': {'key': f'NOC-{rnd.randint(1, issues)}'},
+                },
+            })
+
+        self.channels = [{
+            'id': f'C{i:05d}',
+            'name': f'noc-issue-{i}' if i % 2 else f'random-{i}',
+            'created': int(time.time()) - i * 3600,
+            'is_archived': i % 3 == 0,
+            'topic': {'value': f'Topic for channel {i}'},
+        } for i in range(channels)]
+
+    def search(self, start, size, fields):
+        page = self.issues[start:start + size]
+        if fields:
+            page = [dict(issue, fields={k: v for k, v in issue['fields'].items() if k in fields}) for issue in page]
+        return {'startAt': start, 'maxResults': size, 'total': len(self.issues), 'issues': page}
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    data = None
+    latency = 0.0
+    counts = {}
+
+    def log_message(self, *args):  # Quiet, this is for benchmarks
+        pass
+
+    def _reply(self, body, status=200):
+        raw = json.dumps(body).encode() if not isinstance(body, bytes) else body
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(raw or b'{}')
+        return self._params(raw.decode())
+
+    @staticmethod
+    def _params(qs):
+        # Repeated fields=... (the jira client sends one per field) are folded back into one comma separated value
+        return {k: ','.join(v) if k == 'fields' else v[0] for k, v in parse_qs(qs).items()}
+
+    def _route(self, method):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        path = url.path
+        FakeHandler.counts[path] = FakeHandler.counts.get(path, 0) + 1
+        body = self._body() if method in ('POST', 'PUT') else self._params(url.query)
+
+        if path == '/rest/api/2/serverInfo':
+            return self._reply({'baseUrl': self.data.base_url, 'version': '1001.0.0', 'versionNumbers': [1001, 0, 0],
+                                'deploymentType': 'Cloud'})
+        if path == '/rest/api/2/field':  # Fetched by the jira client on startup
+            return self._reply([{'id': k, 'name': k, 'custom': False} for k in self.data.issues[0]['fields']])
+        if path == '/rest/api/2/search':
+            fields = body.get('fields') or []
+            if isinstance(fields, str):
+                fields = fields.split(',')
+            return self._reply(self.data.search(int(body.get('startAt', 0)), int(body.get('maxResults', 50)), fields))
+        if path.startswith('/rest/api/2/project/'):
+            return self._reply({'id': '1', 'key': path.rsplit('/', 1)[-1]})
+        if path == '/rest/api/2/issue' and method == 'POST':
+            return self._reply({'id': '99999', 'key': 'NOC-99999', 'self': f'{self.data.base_url}rest/api/2/issue/99999'},
+                               201)
+        if path.startswith('/rest/api/2/issue/'):
+            if method == 'PUT':
+                return self._reply(b'', 204)
+            return self._reply({'id': '99999', 'key': 'NOC-99999', 'self': f'{self.data.base_url}rest/api/2/issue/99999',
+                                'fields': {'summary': 'Bench NOC Handover'}})
+
+        if path == '/webhook':
+            return self._reply(b'ok')
+        if path in ('/api/views.open', '/api/views.update'):
+            return self._reply({'ok': True})
+        if path == '/api/channels.list':
+            return self._reply({'ok': True, 'channels': self.data.channels, 'response_metadata': {'next_cursor': ''}})
+
+        return self._reply({'error': f'not faked: {method} {path}'}, 404)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+
+def serve(port=0, latency=0.0, issues=200, channels=20):
+    """Starts the fakes in a background thread, returns (server, base url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeHandler)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+    FakeHandler.data = FakeData(base_url, issues, channels)
+    FakeHandler.latency = latency
+    FakeHandler.counts = {}
+
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--issues', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=20)
+    args = parser.parse_args()
+
+    server, url = serve(args.port, args.latency, args.issues, args.channels)
+    print(f'Fake Jira/Slack listening on {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
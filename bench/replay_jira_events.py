@@ -0,0 +1,66 @@
+"""Replays Jira issue webhook events against a running noc_status, to try out /jira-webhook locally.
+
+Events come from a JSONL file (one webhook body per line, e.g. captured from Jira) or, without one,
+a few synthetic created/updated/deleted events are made up.
+
+Usage: python bench/replay_jira_events.py --url http://localhost:8080/jira-webhook --secret s3cret [events.jsonl]
+"""
+from urllib.request import Request, urlopen
+from urllib.parse import urlencode
+import argparse
+import json
+import time
+
+
+def synthetic():
+    def event(kind, key, issue_type, priority='2'):
+        return {
+            'webhookEvent': f'jira:issue_{kind}',
+            'timestamp': int(time.time() * 1000),
+            'issue': {
+                'key': key,
+                'fields': {
+                    'project': {'key': 'NOC'},
+                    'issuetype': {'name': issue_type},
+                    'priority': {'id': priority, 'name': priority},
+                    'summary': f'Replayed {kind} event for {key}',
+                },
+            },
+        }
+
+    return [
+        event('created', 'NOC-90001', 'Incident'),
+        event('updated', 'NOC-90001', 'Incident', priority='1'),
+        event('updated', 'NOC-90002', 'Change Record'),
+        event('created', 'NOC-90003', 'Sub-task'),
+        event('deleted', 'NOC-90001', 'Incident'),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('events', nargs='?', help='JSONL file of webhook bodies')
+    parser.add_argument('--url', default='http://localhost:8080/jira-webhook')
+    parser.add_argument('--secret', required=True)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds between events')
+    args = parser.parse_args()
+
+    if args.events:
+        with open(args.events) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = synthetic()
+
+    url = f'{args.url}?{urlencode({"secret": args.secret})}'
+    for event in events:
+        request = Request(url, data=json.dumps(event).encode(), headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        with urlopen(request) as response:
+            body = json.loads(response.read())
+        print(f'{event["webhookEvent"]:>18} {event["issue"]["key"]}: {(time.perf_counter() - started) * 1000:.1f} ms, '
+              f'affected {", ".join(body["affected"]) or "nothing"}')
+        time.sleep(args.delay)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from settings import TZ
+from threading import Lock, Thread
+from datetime import datetime
+import metrics
+import time
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def _is_failure(error):
+    # Client errors mean our request was bad, not that the upstream is in trouble (rate limiting aside)
+    status = getattr(error, 'status_code', None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+class CircuitBreaker():
+    """Stops calling an upstream after `failures` failures in a row, so callers fail fast instead of piling up.
+
+    While open, one background thread runs `probe` every `retry_after` seconds. The first probe that
+    succeeds closes the circuit again and then runs the `on_recover` callbacks (from that same thread)."""
+
+    def __init__(self, name, probe, failures, retry_after):
+        self.name = name
+        self.probe = probe
+        self.failures = failures
+        self.retry_after = retry_after
+        self.opened_at = None  # Epoch seconds, None while closed
+        self._failed = 0       # Consecutive failures so far
+        self._on_recover = []
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def on_recover(self, callback):
+        self._on_recover.append(callback)
+        return callback
+
+    def check(self):
+        """Raises CircuitOpen instead of letting a call through while the upstream is considered down"""
+        if self.is_open:
+            metrics.inc('circuit_rejections_total', upstream=self.name)
+            since = datetime.fromtimestamp(self.opened_at, TZ).strftime('%H:%M')
+            raise CircuitOpen(f'{self.name} is unavailable (since {since})')
+
+    def call(self, func, *args, **kwargs):
+        self.check()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if _is_failure(e):
+                self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        with self._lock:
+            self._failed = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failed += 1
+            if self.is_open or self._failed < self.failures:
+                return
+            self.opened_at = time.time()  # Only ever set here, so there's only ever one probing thread
+
+        print(f'Circuit for {self.name} opened after {self.failures} failures in a row, last one: {error!r}')
+        metrics.inc('circuit_transitions_total', upstream=self.name, state='open')
+        Thread(target=self._probe_until_closed, daemon=True).start()
+
+    def _probe_until_closed(self):
+        while True:
+            time.sleep(self.retry_after)
+            try:
+                self.probe()
+                break
+            except Exception as e:
+                print(f'{self.name} still unavailable: {e!r}')
+
+        with self._lock:
+            self.opened_at = None
+            self._failed = 0
+
+        print(f'Circuit for {self.name} closed again')
+        metrics.inc('circuit_transitions_total', upstream=self.name, state='closed')
+        for callback in self._on_recover:
+            try:
+                callback()
+            except Exception as e:
+                print(f'Refreshing after {self.name} recovered failed: {e!r}')
+
+    def state(self):
+        return {'open': self.is_open, 'opened_at': self.opened_at, 'failures': self._failed}
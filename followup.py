@@ -1,33 +1,57 @@
 from settings import TZ, Intervals
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
 
 
-def _needs_followup(issue, p, t):
-        '''Following a pretty straightforward lexical convention, this funciton should simply return True/False'''
+@lru_cache(maxsize=4096)
+def _day_epoch(y, m, d):
+    # Thousands of issues only span a handful of distinct days, no need to redo the calendar math
+    return (date(y, m, d).toordinal() - 719163) * 86400  # 719163 is 1970-01-01
 
-        last_touched = datetime.strptime(issue.fields.updated, '%Y-%m-%dT%H:%M:%S.%f%z')
 
-        # Simple concept calls for parsimony of var naming I think
-        _d = t - last_touched
-        time_since = _d.total_seconds()  # SECONDS since ticket was last touched
+def epoch(ts):
+    '''Jira timestamps ('2020-01-15T03:12:45.000-0800') to epoch seconds, without going through strptime'''
+    offset = (int(ts[-4:-2]) * 3600 + int(ts[-2:]) * 60) * (-1 if ts[-5] == '-' else 1)
+    return (
+        _day_epoch(int(ts[0:4]), int(ts[5:7]), int(ts[8:10])) +
+        int(ts[11:13]) * 3600 + int(ts[14:16]) * 60 + int(ts[17:19]) - offset)
 
-        should_followup = (  # Will either be True or False
-            p == 2 and time_since > Intervals.P2 or
-            p == 3 and time_since > Intervals.P3 or
-            p == 4 and time_since > Intervals.P4
-        )
 
-        return should_followup
+def evaluate(issues, now=None, thresholds=None, warn_at=None):
+    '''Checks every issue against its priority's follow-up threshold in one pass.
 
+    Returns two lists of (issue, seconds) tuples: issues past their SLA (seconds overdue, most overdue
+    first) and issues getting close to it (seconds left, closest first). Priorities without a threshold
+    are never flagged.'''
+    thresholds = Intervals.BY_PRIORITY if thresholds is None else thresholds
+    warn_at = Intervals.WARN_AT if warn_at is None else warn_at
+    now = (now or datetime.now(TZ)).timestamp()
 
-def filter_followup(issues):
-    now = datetime.now(TZ)
+    issues = list(issues)
+    limits = [thresholds.get(int(i.fields.priority.id)) for i in issues]
+    ages = [now - epoch(i.fields.updated) for i in issues]  # SECONDS since each ticket was last touched
+
+    overdue = []
+    approaching = []
+    for issue, limit, age in zip(issues, limits, ages):
+        if limit is None:
+            continue
+        if age > limit:
+            overdue.append((issue, age - limit))
+        elif age > limit * warn_at:
+            approaching.append((issue, limit - age))
+
+    overdue.sort(key=lambda pair: pair[1], reverse=True)
+    approaching.sort(key=lambda pair: pair[1])
 
-    followup_issues = []
-    for issue in issues:
-        priority = int(issue.fields.priority.id)
+    return overdue, approaching
+
+
+def filter_followup(issues):
+    overdue, _ = evaluate(issues)
+    return [issue for issue, _ in overdue]
 
-        if _needs_followup(issue, priority, now):
-            followup_issues.append(issue)
 
-    return followup_issues
+def filter_approaching(issues):
+    _, approaching = evaluate(issues)
+    return [issue for issue, _ in approaching]
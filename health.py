@@ -0,0 +1,38 @@
+import jira_interface
+import slack_interface
+import time
+import sys
+
+
+def _check(func, breaker):
+    started = time.monotonic()
+    try:
+        detail = func()
+        ok = True
+    except Exception as e:
+        detail = repr(e)
+        ok = False
+    return {'ok': ok, 'detail': detail, 'seconds': round(time.monotonic() - started, 3), 'circuit': breaker.state()}
+
+
+def probe():
+    """Checks that Jira and Slack are reachable (and that our credentials work)"""
+    return {
+        'jira': _check(jira_interface.probe, jira_interface.breaker),
+        'slack': _check(slack_interface.probe, slack_interface.breaker),
+    }
+
+
+def circuits():
+    """What the circuit breakers currently think of Jira and Slack, without calling either of them"""
+    return {
+        'jira': jira_interface.breaker.state(),
+        'slack': slack_interface.breaker.state(),
+    }
+
+
+if __name__ == '__main__':
+    results = probe()
+    for name, result in results.items():
+        print(f'{name}: {"OK" if result["ok"] else "FAIL"} ({result["seconds"]}s) {result["detail"]}')
+    sys.exit(0 if all(r['ok'] for r in results.values()) else 1)
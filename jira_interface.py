@@ -1,15 +1,256 @@
-from settings import TZ, JiraSettings
+from settings import TZ, JiraSettings, CacheSettings, AsyncSettings, BreakerSettings
+from breaker import CircuitBreaker
+from collections import OrderedDict
+from threading import Lock, Event
 from datetime import datetime
-from jira.client import JIRA
+from types import SimpleNamespace
+import metrics
+import aio
+import time
 
 
 _SEP = '—' * 35 + '\n\n'
 
-session = JIRA(JiraSettings.URL, basic_auth=(JiraSettings.USER, JiraSettings.TOKEN))
+_session = None
+_session_lock = Lock()
 
 
-def get_tickets(query):
-    return session.search_issues(query)
+def get_session():
+    """The JIRA client, built (handshake included) the first time something actually needs it"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            from jira.client import JIRA  # Heavy import, no need to pay for it until now
+            _session = JIRA(JiraSettings.URL, basic_auth=(JiraSettings.USER, JiraSettings.TOKEN),
+                            timeout=JiraSettings.TIMEOUT)
+    return _session
+
+
+def _issue(raw):
+    session = get_session()  # First, jira.client is only safe to import under its lock
+    from jira.resources import Issue
+    return Issue(session._options, session._session, raw=raw)
+
+
+def _normalize(query):
+    # Whitespace is the only thing we can safely fold, JQL string literals are case sensitive
+    return ' '.join(query.split())
+
+
+class _QueryCache():
+    """LRU of search results keyed by normalized JQL (plus fields/limit), bounded by the total number of issues held.
+
+    Concurrent misses for the same query wait on the first caller instead of hitting Jira again."""
+
+    def __init__(self, max_issues):
+        self.max_issues = max_issues
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, issues)
+        self._in_flight = {}           # key -> Event
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key, fetch, ttl, refresh=False):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and not refresh and entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc('jira_cache_total', result='hit')
+                    return entry[1]
+
+                pending = self._in_flight.get(key)
+                if pending is None:  # Nobody is fetching it, so it's on us
+                    pending = self._in_flight[key] = Event()
+                    self.misses += 1
+                    metrics.inc('jira_cache_total', result='miss')
+                    break
+
+            metrics.inc('jira_cache_total', result='collapsed')
+
+            # Someone else is already asking Jira, wait and then re-check the cache
+            pending.wait()
+            refresh = False
+
+        try:
+            issues = fetch()
+            with self._lock:
+                self._store(key, issues, ttl)
+            return issues
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            pending.set()
+
+    def has(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(entry) and entry[0] > time.monotonic()
+
+    def put(self, key, issues, ttl):
+        with self._lock:
+            self._store(key, issues, ttl)
+
+    def _store(self, key, issues, ttl):
+        self._discard(key)
+        if ttl <= 0:  # Meant to be used once, e.g. a count
+            return
+        self._entries[key] = (time.monotonic() + ttl, issues)
+        self._size += len(issues)
+
+        while self._size > self.max_issues and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._size -= len(entry[1])
+
+    def invalidate(self, query=None):
+        with self._lock:
+            if query is None:
+                self._entries.clear()
+                self._size = 0
+                return
+
+            # Same JQL may be cached under several field lists/limits
+            query = _normalize(query)
+            for key in [k for k in self._entries if k[0] == query]:
+                self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'queries': len(self._entries), 'issues': self._size}
+
+
+cache = _QueryCache(CacheSettings.MAX_ISSUES)
+
+
+class Results(list):
+    """Plain list of issues that also remembers how many Jira says matched in total"""
+    def __init__(self, issues=(), total=None):
+        list.__init__(self, issues)
+        self.total = len(self) if total is None else total
+
+
+def _to_results(data):
+    # Same Issue objects the sync client hands back, so nothing downstream can tell the difference.
+    # Only ever called by sync callers once the data is back, building them needs the (blocking) JIRA client.
+    return Results((_issue(raw) for raw in data['issues']), data['total'])
+
+
+# The async searches hand back Jira's raw JSON ({'issues': [...], 'total': n}), see _to_results
+async def search_page_async(query, start, size, fields):
+    started = time.perf_counter()
+    data = await aio.jira_search(query, start, size, fields)
+    metrics.observe('jira_request_seconds', time.perf_counter() - started, call='search_async')
+    metrics.inc('jira_requests_total', call='search_async')
+    metrics.inc('jira_issues_returned_total', len(data['issues']))
+    return data
+
+
+async def search_async(query, fields=None, limit=None):
+    fields = fields or JiraSettings.FIELDS
+    issues = []
+    total = 0
+    start = 0
+
+    while limit is None or start < limit:
+        size = JiraSettings.PAGE_SIZE if limit is None else min(JiraSettings.PAGE_SIZE, limit - start)
+        page = await search_page_async(query, start, size, fields)
+        issues.extend(page['issues'])
+        total = page['total']
+
+        start += len(page['issues'])
+        if not page['issues'] or start >= total:
+            break
+
+    return {'issues': issues, 'total': total}
+
+
+def _search_page(query, start, size, fields):
+    # Every search (counts included) goes through here, so this is where a Jira outage gets noticed
+    return breaker.call(_fetch_page, query, start, size, fields)
+
+
+def _fetch_page(query, start, size, fields):
+    if AsyncSettings.ENABLED:  # Counted in there
+        return _to_results(aio.run(search_page_async(query, start, size, fields)))
+
+    with metrics.timer('jira_request_seconds', call='search'):
+        page = get_session().search_issues(query, startAt=start, maxResults=size, fields=fields)
+
+    metrics.inc('jira_requests_total', call='search')
+    metrics.inc('jira_issues_returned_total', len(page))
+    return page
+
+
+def iter_pages(query, fields=None, limit=None):
+    """Yields one page of issues at a time until the query (or limit) is exhausted"""
+    fields = fields or JiraSettings.FIELDS
+    start = 0
+
+    while limit is None or start < limit:
+        size = JiraSettings.PAGE_SIZE if limit is None else min(JiraSettings.PAGE_SIZE, limit - start)
+        page = _search_page(query, start, size, fields)
+        yield page
+
+        start += len(page)
+        if not page or start >= page.total:
+            break
+
+
+def iter_tickets(query, fields=None, limit=None):
+    for page in iter_pages(query, fields, limit):
+        yield from page
+
+
+def _search(query, fields, limit):
+    issues = Results()
+    for page in iter_pages(query, fields, limit):
+        issues.extend(page)
+        issues.total = page.total
+    return issues
+
+
+def count(query, ttl=0):
+    """Number of matching issues, without bringing any of them back (well, one, Jira won't do zero).
+
+    Only served from the cache if something (e.g. prefetch_many) put it there less than its ttl ago"""
+    return get_tickets(query, ['key'], limit=1, ttl=ttl).total
+
+
+def _cache_key(query, fields, limit):
+    return (_normalize(query), tuple(sorted(set(fields))), limit)
+
+
+def get_tickets(query, fields=None, limit=None, ttl=None, refresh=False):
+    ttl = CacheSettings.TTL if ttl is None else ttl
+    fields = fields or JiraSettings.FIELDS
+    return cache.get(_cache_key(query, fields, limit), lambda: _search(query, fields, limit), ttl, refresh=refresh)
+
+
+def prefetch_many(searches):
+    """Runs several (query, fields, limit, ttl) searches at once on the async backend, straight into the cache.
+
+    Later get_tickets calls for the same searches are then just cache hits. Failures are left for those
+    calls to retry (and report) on their own."""
+    if breaker.is_open:  # Not worth it, the sections will fall back on their own
+        return
+
+    searches = [(q, f or JiraSettings.FIELDS, lim, CacheSettings.TTL if ttl is None else ttl)
+                for q, f, lim, ttl in searches]
+    searches = [s for s in searches if not cache.has(_cache_key(*s[:3]))]
+    if not searches:  # Everything is cached already, no need to spin up the event loop
+        return
+
+    results = aio.gather(*[search_async(q, f, lim) for q, f, lim, _ in searches])
+
+    for (query, fields, limit, ttl), data in zip(searches, results):
+        if not isinstance(data, Exception):
+            cache.put(_cache_key(query, fields, limit), _to_results(data), ttl)
 
 
 def create_ticket(pfx, sections):
@@ -24,10 +265,51 @@ def create_ticket(pfx, sections):
         'issuetype': {'name': 'Story'},
     }
 
-    ticket = session.create_issue(fields=issue_fields)
+    with metrics.timer('jira_request_seconds', call='create'):
+        ticket = get_session().create_issue(fields=issue_fields)
+    metrics.inc('jira_requests_total', call='create')
     return ticket
 
 
 def update_ticket(ticket, sections):
     descr = ''.join([_SEP + s.get_section() for s in sections])
-    ticket.update(description=descr)
+    with metrics.timer('jira_request_seconds', call='update'):
+        ticket.update(description=descr)
+    metrics.inc('jira_requests_total', call='update')
+
+
+# Just enough of a ticket to update it and link to it later, so a restart doesn't need to look it up again
+def ticket_state(ticket):
+    return {'key': ticket.key, 'self': ticket.self, 'summary': ticket.fields.summary}
+
+
+class _SavedTicket():
+    """Stands in for a ticket restored from ticket_state without talking to Jira, the real Issue
+    (and with it the Jira client) is only built once the ticket actually gets updated"""
+
+    def __init__(self, state):
+        self.key = state['key']
+        self.self = state['self']
+        self.fields = SimpleNamespace(summary=state['summary'])
+        self._issue = None
+
+    def permalink(self):
+        return f'{JiraSettings.URL.rstrip("/")}/browse/{self.key}'
+
+    def update(self, **kwargs):
+        if self._issue is None:
+            self._issue = _issue({'key': self.key, 'self': self.self, 'fields': {'summary': self.fields.summary}})
+        return self._issue.update(**kwargs)
+
+
+def ticket_from_state(state):
+    return _SavedTicket(state)
+
+
+def probe():
+    """Health check, actually talks to Jira (unlike importing this module)"""
+    return get_session().server_info()['version']
+
+
+breaker = CircuitBreaker(
+    'jira', probe=probe, failures=BreakerSettings.FAILURES, retry_after=BreakerSettings.RETRY_AFTER)
@@ -1,40 +1,115 @@
+from state import store
+from archive import archive
 import slack_interface
 import jira_interface
 import sections
+import snapshot
 
 current_ticket = None
+last_sections = []  # What went into current_ticket, so updates only have to fetch what changed
+last_hashes = {}    # Section name -> fingerprint of what current_ticket currently shows
+
+
+def _save_state():
+    store.set('handover', {
+        'ticket': jira_interface.ticket_state(current_ticket),
+        'sections': [s.to_dict() for s in last_sections],
+        'hashes': last_hashes,
+    })
+
+
+def _load_state():
+    # Picks up where we left off if the scheduler was restarted between handovers
+    global current_ticket, last_sections, last_hashes
+
+    saved = store.get('handover')
+    if not saved:
+        return
+
+    current_ticket = jira_interface.ticket_from_state(saved['ticket'])
+    last_sections = [sections.Section.from_dict(s) for s in saved['sections']]
+    last_hashes = saved['hashes']
+    print(f'Resumed handover {current_ticket.key}')
+
+
+_loaded = False
+
+
+def _ensure_loaded():
+    # Deferred to the first job instead of import time, so the scheduler starts up without touching the state
+    global _loaded
+    if not _loaded:
+        _load_state()
+        _loaded = True  # Only once that worked, a failed load is retried by the next job
 
 
 def _send_handover_msg(ho_ticket, sections, preface=''):
-    msg_segments = [f'@here\n{preface}<{ho_ticket.permalink()}|*{ho_ticket.fields.summary}*>']
-    msg_segments.extend([s.get_section(for_slack=True) for s in sections])
-    slack_interface.send_msg(*msg_segments)
+    header = f'@here\n{preface}<{ho_ticket.permalink()}|*{ho_ticket.fields.summary}*>'
+    blocks = slack_interface.join_blocks(slack_interface.block_builder(header), *[s.blocks() for s in sections])
+    slack_interface.send_blocks(blocks)
 
 
 def new_handover(pfx):
     print(f'Commencing "{pfx}" handover job...')
 
-    global current_ticket
-    secs = sections.get_sections()
+    _ensure_loaded()  # Otherwise a later update could resume the old state over this new handover
+
+    global current_ticket, last_sections, last_hashes
+    secs = snapshot.warm_sections()
     current_ticket = jira_interface.create_ticket(pfx, secs)
+    last_sections = secs
+    last_hashes = {s.name: s.fingerprint() for s in secs}
+    _save_state()
     _send_handover_msg(current_ticket, secs)
+    archive.record(current_ticket, secs)
 
     print('Job completed')
 
 
 def update_handover(preface=''):
+    _ensure_loaded()
+
     if not current_ticket:  # In case there is no current_ticket yet
         return
 
     print('Commencing update of last ticket')
 
-    secs = sections.get_sections()
+    global last_sections, last_hashes
+    if last_sections:
+        secs = sections.refresh_sections(last_sections)
+    else:
+        secs = sections.get_sections()
+
+    # Fingerprints are the final word, a refetch that renders the same isn't a change.
+    # Neither is a placeholder for a section that failed, there's nothing new to tell anyone.
+    hashes = {s.name: s.fingerprint() for s in secs}
+    changed = [s for s in secs if s.cursor is not None and hashes[s.name] != last_hashes.get(s.name)]
+
+    last_sections = secs
+    if not changed:
+        _save_state()  # Still worth keeping the fresher cursors
+        print('Nothing changed since the last run, skipping update')
+        return
+
+    print(f'Changed sections: {", ".join(s.name for s in changed)}')
+
+    last_hashes = hashes
     jira_interface.update_ticket(current_ticket, secs)
+    _save_state()
+
+    preface += f'_Updated: {", ".join(s.heading for s in changed)}_\n\n'
     _send_handover_msg(current_ticket, secs, preface=preface)
+    archive.record(current_ticket, secs, kind='update')
 
     print('Job completed')
 
 
+# Fires a few minutes ahead of each handover so the data is already there when it runs
+def prefetch():
+    print('Prefetching handover sections')
+    snapshot.prefetch()
+
+
 def mid_handover():
     PFX = "Mid-Shift"
     new_handover(PFX)
@@ -73,5 +148,5 @@ def followup_reminder():
     if not section.line_items:  # If there's nothing to follow up on, do nothing
         return
 
-    msg = HEADING + section.get_section(for_slack=True)
-    slack_interface.send_msg(msg)
+    blocks = slack_interface.block_builder(HEADING) + section.blocks()
+    slack_interface.send_blocks(blocks)
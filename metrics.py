@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from itertools import groupby
+from threading import Lock
+import time
+
+# In-process counters and timings for the hot paths (Jira/Slack calls, section fetch and render, jobs).
+# Exposed in Prometheus text format by noc_status (/metrics) and summarized after each scheduled job.
+
+_PREFIX = 'noc_news_'
+
+_counters = {}  # (name, labels) -> value
+_timings = {}   # (name, labels) -> [count, sum, max]
+_lock = Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        count, total, biggest = _timings.get(key, (0, 0.0, 0.0))
+        _timings[key] = [count + 1, total + seconds, max(biggest, seconds)]
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def render():
+    """Everything recorded so far, in Prometheus text exposition format"""
+    with _lock:
+        counters = sorted(_counters.items())
+        timings = sorted(_timings.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f'# TYPE {_PREFIX}{name} counter')
+            seen.add(name)
+        lines.append(f'{_PREFIX}{name}{_labels(labels)} {value}')
+
+    # A family's samples have to stay together, so the maximums get a gauge family of their own after it
+    for name, family in groupby(timings, key=lambda t: t[0][0]):
+        family = list(family)
+        lines.append(f'# TYPE {_PREFIX}{name} summary')
+        for (_, labels), (count, total, _) in family:
+            lines.append(f'{_PREFIX}{name}_count{_labels(labels)} {count}')
+            lines.append(f'{_PREFIX}{name}_sum{_labels(labels)} {total:.6f}')
+        lines.append(f'# TYPE {_PREFIX}{name}_max gauge')
+        for (_, labels), (_, _, biggest) in family:
+            lines.append(f'{_PREFIX}{name}_max{_labels(labels)} {biggest:.6f}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters), {k: list(v) for k, v in _timings.items()}
+
+
+def summary(since):
+    """One line with what happened since an earlier snapshot(): counter deltas and the slowest timings"""
+    counters, timings = snapshot()
+    old_counters, old_timings = since
+
+    parts = []
+    totals = {}
+    for (name, labels), value in counters.items():
+        delta = value - old_counters.get((name, labels), 0)
+        if delta:
+            totals[name] = totals.get(name, 0) + delta
+    parts.extend(f'{name}={value}' for name, value in sorted(totals.items()))
+
+    # Slowest section fetch is usually the interesting bit, so name it
+    fetches = []
+    for (name, labels), (count, total, _) in timings.items():
+        old_count, old_total, _ = old_timings.get((name, labels), (0, 0.0, 0.0))
+        if name == 'section_fetch_seconds' and count > old_count:
+            fetches.append(((total - old_total) / (count - old_count), dict(labels).get('section')))
+    if fetches:
+        seconds, section = max(fetches)
+        parts.append(f'slowest_section={section}({seconds:.2f}s)')
+
+    return ' '.join(parts) or 'no activity'
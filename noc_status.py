@@ -1,19 +1,84 @@
 from flask import Flask, jsonify, request
-from slack_interface import client, msg_builder
-from settings import NOCStatSettings
-from threading import Thread
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from slack_interface import client, join_blocks, lines_to_blocks, fit_view, channel_index
+from settings import TZ, NOCStatSettings, JiraSettings
+from datetime import datetime
+from archive import archive, day_range
+from render_queue import RenderQueue
+from state import store
+import metrics
+import health
 import sections
+import snapshot
 import hashlib
 import json
 import hmac
+import time
+
+
+class _ReplayCache():
+    """Signatures seen within the last max_age seconds (anything older is rejected on its timestamp anyway)"""
+
+    def __init__(self, max_age, max_size):
+        self.max_age = max_age
+        self.max_size = max_size
+        self._seen = OrderedDict()  # signature -> request timestamp, oldest first
+        self._lock = Lock()
+
+    def first_time(self, signature, timestamp):
+        with self._lock:
+            cutoff = time.time() - self.max_age
+            while self._seen and (next(iter(self._seen.values())) < cutoff or len(self._seen) >= self.max_size):
+                self._seen.popitem(last=False)
+
+            if signature in self._seen:
+                return False
+            self._seen[signature] = timestamp
+            return True
+
+
+_replays = _ReplayCache(NOCStatSettings.MAX_REQUEST_AGE, NOCStatSettings.REPLAY_CACHE_SIZE)
 
 
 def _verify_signature(request):
-    body = request.get_data().decode('utf-8')
-    timestamp = request.headers['X-Slack-Request-Timestamp']
-    base = f'v0:{timestamp}:{body}'.encode('utf-8')  # Apparently this needs to be ASCII
-    computed_sig = f'v0={hmac.new(NOCStatSettings.SIGN_SECRET, base, digestmod=hashlib.sha256).hexdigest()}'
-    return computed_sig == request.headers['X-Slack-Signature']
+    if not NOCStatSettings.SIGN_SECRET:  # Not configured, nothing can be trusted
+        return False
+
+    timestamp = request.headers.get('X-Slack-Request-Timestamp', '')
+    signature = request.headers.get('X-Slack-Signature', '')
+
+    # Cheapest checks first, stale (or missing) timestamps don't even get hashed
+    try:
+        ts = int(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - ts) > NOCStatSettings.MAX_REQUEST_AGE:
+        return False
+
+    base = b'v0:' + timestamp.encode() + b':' + request.get_data()  # Raw bytes, exactly what Slack signed
+    computed_sig = 'v0=' + hmac.new(NOCStatSettings.SIGN_SECRET, base, digestmod=hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(computed_sig.encode(), signature.encode()):  # Bytes, a junk header can't make it raise
+        return False
+
+    return _replays.first_time(signature, ts)
+
+
+def verified(route):
+    # Runs before the route touches anything else (including parsing the form)
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        if not _verify_signature(request):
+            return ('Invalid secret!', 401)
+        return route(*args, **kwargs)
+    return wrapper
+
+
+def _has_secret(request, expected):
+    # For callers that can't sign their requests (Jira, monitoring), a shared secret in ?secret= instead
+    expected = (expected or '').encode()
+    return bool(expected) and hmac.compare_digest(request.args.get('secret', '').encode(), expected)
 
 
 class TextSection(dict):
@@ -49,6 +114,21 @@ class ButtonSection(dict):
         })
 
 
+class InputSection(dict):
+    def __init__(self, block_id, label, element):
+        dict.__init__(self)
+        self.update({
+            "type": "input",
+            "block_id": block_id,
+            "optional": True,
+            "label": {
+                "type": "plain_text",
+                "text": label
+            },
+            "element": dict(element, action_id="value")
+        })
+
+
 class OnDemandView(dict):
     def __init__(self, blocks):
         dict.__init__(self)
@@ -79,33 +159,108 @@ def initial_view():
     client.views_open(trigger_id=request.form['trigger_id'], view=view)
 
 
-def interm_view(vid):
+def _view_blocks(secs):
+    return fit_view(join_blocks(*[s.blocks(max_len=200) for s in secs]))
+
+
+def interm_view(vid, selection):
+    if NOCStatSettings.PROGRESSIVE:  # Every section's heading right away, they fill in as they're fetched
+        blocks = _view_blocks([sections.loading(name) for name in sections.component_names(selection)])
+    else:
+        blocks = [
+            TextSection("One moment while I cook that up for you...")
+        ]
+    view = OnDemandView(blocks)
+    client.views_update(view=view, view_id=vid)
+
+
+def busy_view(vid):
+    blocks = [
+        TextSection("Too many requests in flight right now, please try again in a minute.")
+    ]
+    view = OnDemandView(blocks)
+    client.views_update(view=view, view_id=vid)
+
+
+def search_view(vid):
     blocks = [
-        TextSection("One moment while I cook that up for you...")
+        TextSection('Search the handovers that went out, by any combination of these:'),
+        InputSection('key', 'Issue key', {"type": "plain_text_input"}),
+        InputSection('text', 'Keywords', {"type": "plain_text_input"}),
+        InputSection('since', 'From', {"type": "datepicker"}),
+        InputSection('until', 'To', {"type": "datepicker"}),
     ]
     view = OnDemandView(blocks)
+    view.update({
+        "callback_id": "archive_search",
+        "submit": {
+            "type": "plain_text",
+            "text": "Search"
+        }
+    })
     client.views_update(view=view, view_id=vid)
 
 
-def final_view(vid, selection):
-    _secs = sections.get_sections(selection)
-    segments = [s.get_section(for_slack=True, max_len=200) for s in _secs]
+def _search_input(values):
+    # Submitted state of each search_view input, whatever the user left empty comes back as an empty dict
+    return {block_id: values.get(block_id, {}).get('value') or {} for block_id in ('key', 'text', 'since', 'until')}
+
+
+def search_results(field):
+    # Straight out of the local archive, quick enough to answer within the submission's own request
+    since, until = day_range(field['since'].get('selected_date'), field['until'].get('selected_date'))
+    found = archive.search(key=field['key'].get('value'), text=field['text'].get('value'), since=since, until=until)
+
+    lines = [f'*Most recent {len(found)} matches:*' if found else '_No past handovers match that._', '']
+    for f in found:
+        at = datetime.fromtimestamp(f['at'], TZ).strftime('%Y-%m-%d %H:%M')
+        lines.append(f'*{at}* <{f["ticket_link"]}|{f["ticket"]}> — {f["heading"]}')
+        lines.append(f'<{f["link"]}|{f["key"]}>: {f["summary"][:200]}')
+        lines.append('')
+
+    return OnDemandView(fit_view(lines_to_blocks(lines)))
+
+
+def render_blocks(selection, progress):
+    if not NOCStatSettings.PROGRESSIVE:
+        return _view_blocks(snapshot.warm_sections(selection))
+
+    # Sections land in their own slot whatever order they finish in, so nothing jumps around in the view
+    slots = [sections.loading(name) for name in sections.component_names(selection)]
+    remaining = [len(slots)]
+
+    def on_section(i, section):
+        slots[i] = section
+        remaining[0] -= 1
+        if remaining[0]:  # The last one goes out with the final view anyway
+            progress(_view_blocks(slots))
+
+    return _view_blocks(snapshot.warm_sections(selection, on_section=on_section))
+
+
+def final_view(vid, blocks):
+    if isinstance(blocks, Exception):  # Rendering blew up, at least let the user know
+        blocks = [TextSection(f"Sorry, something went wrong ({type(blocks).__name__}).")]
 
-    blocks = msg_builder(*segments)
     view = OnDemandView(blocks)
     client.views_update(view=view, view_id=vid)
 
 
+render_queue = RenderQueue(
+    render=render_blocks,
+    deliver=final_view,
+    workers=NOCStatSettings.RENDER_WORKERS,
+    max_depth=NOCStatSettings.RENDER_QUEUE_DEPTH,
+    min_interval=NOCStatSettings.UPDATE_INTERVAL)
+
+
 app = Flask(__name__)
 
 
 # This presents the initial view
 @app.route('/noc-status', methods=['POST'])
+@verified
 def noc_status():
-    # Check for correct signing secret
-    if not _verify_signature(request):
-        return 'Invalid secret!'
-
     # Check for user authorization
     user_name = request.form['user_name']
     if user_name not in NOCStatSettings.AUTHORIZED_USERS:
@@ -119,18 +274,89 @@ def noc_status():
 
 # Listens for any button clicks
 @app.route('/interaction', methods=['POST'])
+@verified
 def interaction():
 
     payload = json.loads(request.form['payload'])
+
+    if payload['type'] == 'view_submission' and payload['view'].get('callback_id') == 'archive_search':
+        field = _search_input(payload['view']['state']['values'])
+        if not any((f.get('value') or '').strip() or f.get('selected_date') for f in field.values()):
+            return jsonify({'response_action': 'errors', 'errors': {'key': 'Fill in at least one of these'}})
+        return jsonify({'response_action': 'update', 'view': search_results(field)})
+
     vid = payload['view']['id']
     selection = payload['actions'][0]['value']
 
+    # Searching the archive needs some input first, nothing to render yet
+    if selection == 'archive_search':
+        search_view(vid)
+        return ('', 200)
+
     # First we call the intermediate view (because shit takes time [also 3 sec timeout])
-    interm_view(vid)
+    interm_view(vid, selection)
+
+    # This takes some time. It's queued up so that we can return this route immediately.
+    if not render_queue.submit(selection, vid):
+        busy_view(vid)
+
+    return ('', 200)
+
+
+# Queue depth plus wait/render times per selection
+@app.route('/render-queue', methods=['GET'])
+def render_queue_stats():
+    return jsonify(render_queue.stats())
+
+
+# Recent scheduled job runs (start, duration, outcome), ?secret=<ops secret> and optionally &job=<job id>&limit=<n>
+@app.route('/job-runs', methods=['GET'])
+def job_runs():
+    if not _has_secret(request, NOCStatSettings.OPS_SECRET):
+        return ('Invalid secret!', 401)
+
+    return jsonify(store.job_runs(request.args.get('job'), request.args.get('limit', 50, type=int)))
+
+
+# Prometheus scrape endpoint for this process (the scheduler logs its own summary after every job)
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return (metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'})
+
+
+# Circuit state for Jira and Slack, cheap enough to poll. `python health.py` actually talks to both
+@app.route('/health', methods=['GET'])
+def health_check():
+    if not _has_secret(request, NOCStatSettings.OPS_SECRET):
+        return ('Invalid secret!', 401)
+
+    results = health.circuits()
+    ok = not any(r['open'] for r in results.values())
+    return jsonify(results), 200 if ok else 503
+
+
+# Jira issue created/updated/deleted webhooks, keeps the shared snapshot fresh without polling
+@app.route('/jira-webhook', methods=['POST'])
+def jira_webhook():
+    if not _has_secret(request, JiraSettings.WEBHOOK_SECRET):
+        return ('Invalid secret!', 401)
+
+    affected = snapshot.apply_jira_event(request.get_json(force=True))
+    return jsonify({'affected': affected})
+
+
+# Slack Events API, only subscribed to channel_* events to keep the channel index current
+@app.route('/slack-events', methods=['POST'])
+@verified
+def slack_events():
+    payload = request.get_json()
+
+    # Slack sends this once when the URL is first configured
+    if payload['type'] == 'url_verification':
+        return jsonify({'challenge': payload['challenge']})
 
-    # This takes some time. It will be threaded so that we can return this route immediately.
-    final_view_thread = Thread(target=lambda: final_view(vid, selection))
-    final_view_thread.start()
+    if payload['type'] == 'event_callback':
+        channel_index.apply_event(payload['event'])
 
     return ('', 200)
 
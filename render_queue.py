@@ -0,0 +1,153 @@
+from threading import Lock, Thread, Timer
+from queue import Queue, Full
+import time
+
+
+class _Progress():
+    """Passed to render so it can hand out partial results before the final one.
+
+    At most one partial goes out per min_interval, anything arriving faster is coalesced into the
+    latest one and sent when the interval is up. Nothing gets through once the render has finished."""
+
+    def __init__(self, queue, selection, min_interval):
+        self._queue = queue
+        self._selection = selection
+        self._min_interval = min_interval
+        self._last = 0.0      # When the previous partial went out
+        self._latest = None   # Newest partial not sent yet
+        self._timer = None
+        self._done = False
+        self._lock = Lock()
+
+    def __call__(self, partial):
+        with self._lock:
+            if self._done:
+                return
+            self._latest = partial
+            wait = self._last + self._min_interval - time.monotonic()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = Timer(wait, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self._flush()
+
+    def _flush(self):
+        # Delivers while holding the lock, so close() can't let the final result be overtaken by a partial
+        with self._lock:
+            self._timer = None
+            if self._done or self._latest is None:
+                return
+            partial, self._latest = self._latest, None
+            self._last = time.monotonic()
+            self._queue._fan_out(self._selection, self._queue._waiting(self._selection), partial)
+            with self._queue._lock:
+                self._queue._stat(self._selection)['partials'] += 1
+
+    def close(self):
+        with self._lock:
+            self._done = True
+            if self._timer:
+                self._timer.cancel()
+
+
+class RenderQueue():
+    """Bounded pool of workers rendering on-demand views.
+
+    Requests for a selection that is already queued (or rendering) just wait on that one render,
+    and once the queue is full new requests are turned away instead of piling up more threads.
+    Partial results a render reports along the way go to everyone waiting on it, throttled."""
+
+    def __init__(self, render, deliver, workers, max_depth, min_interval=1.0):
+        self._render = render    # (selection, progress) -> result, progress(partial) is optional to call
+        self._deliver = deliver  # (view id, result, a partial one or an exception) -> None
+        self._min_interval = min_interval
+        self._queue = Queue(maxsize=max_depth)
+        self._pending = {}       # selection -> view ids waiting on it
+        self._stats = {}         # selection -> running totals
+        self._lock = Lock()
+
+        for _ in range(workers):
+            Thread(target=self._work, daemon=True).start()
+
+    def submit(self, selection, vid):
+        """Returns False if the queue is full and the request was dropped"""
+        with self._lock:
+            if selection in self._pending:
+                self._pending[selection].append(vid)
+                self._stat(selection)['deduped'] += 1
+                return True
+
+            try:
+                self._queue.put_nowait((selection, time.monotonic()))
+            except Full:
+                self._stat(selection)['rejected'] += 1
+                return False
+
+            self._pending[selection] = [vid]
+            return True
+
+    def _work(self):
+        while True:
+            selection, queued_at = self._queue.get()
+            started = time.monotonic()
+            progress = _Progress(self, selection, self._min_interval)
+
+            try:
+                result = self._render(selection, progress)
+            except Exception as e:
+                print(f'Rendering "{selection}" failed: {e!r}')
+                result = e
+
+            progress.close()
+            finished = time.monotonic()
+
+            # Anyone who asked while this was rendering gets the same result
+            with self._lock:
+                vids = self._pending.pop(selection)
+                stat = self._stat(selection)
+                stat['renders'] += 1
+                stat['wait_total'] += started - queued_at
+                stat['wait_max'] = max(stat['wait_max'], started - queued_at)
+                stat['render_total'] += finished - started
+                stat['render_max'] = max(stat['render_max'], finished - started)
+
+            self._fan_out(selection, vids, result)
+            self._queue.task_done()
+
+    def _waiting(self, selection):
+        with self._lock:
+            return list(self._pending.get(selection, ()))
+
+    def _fan_out(self, selection, vids, result):
+        for vid in vids:
+            try:
+                self._deliver(vid, result)
+            except Exception as e:
+                print(f'Delivering "{selection}" to {vid} failed: {e!r}')
+
+    def _stat(self, selection):
+        if selection not in self._stats:
+            self._stats[selection] = {
+                'renders': 0, 'deduped': 0, 'rejected': 0, 'partials': 0,
+                'wait_total': 0.0, 'wait_max': 0.0, 'render_total': 0.0, 'render_max': 0.0}
+        return self._stats[selection]
+
+    def stats(self):
+        with self._lock:
+            selections = {}
+            for selection, s in self._stats.items():
+                renders = s['renders'] or 1  # Avoids dividing by zero when only rejections happened
+                selections[selection] = {
+                    'renders': s['renders'],
+                    'deduped': s['deduped'],
+                    'rejected': s['rejected'],
+                    'partials': s['partials'],
+                    'wait_avg': round(s['wait_total'] / renders, 3),
+                    'wait_max': round(s['wait_max'], 3),
+                    'render_avg': round(s['render_total'] / renders, 3),
+                    'render_max': round(s['render_max'], 3),
+                }
+
+            return {'depth': self._queue.qsize(), 'in_flight': len(self._pending), 'selections': selections}
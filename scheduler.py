@@ -1,30 +1,76 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
-from settings import TZ
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from settings import TZ, SchedulerSettings, SnapshotSettings
+from functools import wraps
+from state import store
+import traceback
+import metrics
+import time
 import jobs
 
 
+def _tracked(job_id, func):
+    # Records start, duration and outcome of every run so slow-downs show up over time
+    @wraps(func)
+    def run():
+        started = time.time()
+        before = metrics.snapshot()
+        outcome = 'ok'
+        try:
+            func()
+        except Exception as e:
+            outcome = 'error'
+            store.record_run(job_id, started, time.time() - started, outcome, repr(e))
+            traceback.print_exc()
+        else:
+            store.record_run(job_id, started, time.time() - started, outcome)
+
+        duration = time.time() - started
+        metrics.observe('job_seconds', duration, job=job_id, outcome=outcome)
+        # Note other jobs running at the same time show up in here too
+        print(f'[{job_id}] {outcome} in {duration:.2f}s: {metrics.summary(before)}')
+    return run
+
+
+def _on_skipped(event):
+    # Runs that never started: too late (missed) or the previous run was still going (max_instances)
+    if event.code == EVENT_JOB_MISSED:
+        outcome, scheduled = 'missed', [event.scheduled_run_time]
+    else:
+        outcome, scheduled = 'overlap', event.scheduled_run_times
+
+    print(f'Skipped {event.job_id} ({outcome})')
+    store.record_run(event.job_id, time.time(), None, outcome, ', '.join(str(t) for t in scheduled))
+
+
 def scheduler():
-    sched = BlockingScheduler()
+    sched = BlockingScheduler(
+        executors={'default': ThreadPoolExecutor(SchedulerSettings.WORKERS)},
+        job_defaults={
+            'coalesce': SchedulerSettings.COALESCE,
+            'max_instances': 1,  # A job still running when its next run comes up gets that run skipped
+            'misfire_grace_time': SchedulerSettings.MISFIRE_GRACE,
+        })
+    sched.add_listener(_on_skipped, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    def add(func, **cron):
+        sched.add_job(_tracked(func.__name__, func), 'cron', id=func.__name__, timezone=TZ, **cron)
+
+    # Warm up handover data ahead of the new handover jobs below. Not ahead of am_update, that one
+    # refreshes the sections it already has (incrementally) and never reads the snapshot.
+    add(jobs.prefetch, hour='14,23', minute=str(30 - SnapshotSettings.PREFETCH_LEAD))
 
     # Handover Jobs:
-    sched.add_job(
-        jobs.am_update, 'cron', hour='05', minute='30', timezone=TZ)
-    sched.add_job(
-        jobs.mid_handover, 'cron', hour='14', minute='30', timezone=TZ)
-    sched.add_job(
-        jobs.on_handover, 'cron', hour='23', minute='30', timezone=TZ)
+    add(jobs.am_update, hour='05', minute='30')
+    add(jobs.mid_handover, hour='14', minute='30')
+    add(jobs.on_handover, hour='23', minute='30')
 
     # Standup reminder:
-    sched.add_job(
-        jobs.standup_reminder, 'cron', hour='15', timezone=TZ)
-
-    # Followup reminder jobs:
-    sched.add_job(
-        jobs.followup_reminder, 'cron', hour='09', timezone=TZ)
-    sched.add_job(
-        jobs.followup_reminder, 'cron', hour='14', timezone=TZ)
-    sched.add_job(
-        jobs.followup_reminder, 'cron', hour='17', timezone=TZ)
+    add(jobs.standup_reminder, hour='15')
+
+    # Followup reminder jobs (one job so runs can't overlap each other):
+    add(jobs.followup_reminder, hour='09,14,17')
 
     print('Starting jobs scheduler...\n')
 
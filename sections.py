@@ -1,112 +1,268 @@
-from settings import TZ, COMPONENTS, HO_COMPONENTS
-from datetime import date, datetime
+from settings import TZ, COMPONENTS, HO_COMPONENTS, QUERY_GROUPS, FetchSettings, AsyncSettings
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from functools import lru_cache
+from operator import attrgetter
+from string import Formatter
+from datetime import date, datetime, timedelta
+import hashlib
+import time
+import re
 import slack_interface
 import jira_interface
 import followup
+import metrics
 
 
-class LineItem():
-    def __init__(self, **fields):
-        self.fields = fields
+_CURSOR_FMT = '%Y-%m-%dT%H:%M:%S.%f%z'
+
+
+class LineFormat():
+    """A line_fmt parsed once up front, rendering is then just a join over the item's attributes"""
+    __slots__ = ('_parts',)
+
+    def __init__(self, line_fmt):
+        self._parts = []
+        for literal, field, spec, conversion in Formatter().parse(line_fmt):
+            if field is not None and (spec or conversion):  # Not used by any of our formats, but just in case
+                raise ValueError(f'Unsupported field in line format: {line_fmt!r}')
+            self._parts.append((literal, attrgetter(field) if field is not None else None))
+
+    def render(self, item):
+        return ''.join(literal + ('' if get is None else str(get(item))) for literal, get in self._parts)
+
+
+@lru_cache(maxsize=None)
+def _compile(line_fmt):
+    return LineFormat(line_fmt)
 
-    # These methods return the line_fmt with any vars expanded from the item itself
+
+class LineItem():
+    # Fixed schema and no per-instance dict, there can be thousands of these
+    __slots__ = (
+        'key', 'priority', 'created', 'updated', 'summary', 'link', 'parent_key', 'due',
+        # Raw values below are only kept around for incremental refreshes (sorting and change detection)
+        'priority_id', 'duedate', 'updated_at')
+
+    def __init__(self, key, summary, link, priority=None, created='', updated='', parent_key=None, due=None,
+                 priority_id=None, duedate='', updated_at=''):
+        self.key = key
+        self.priority = priority
+        self.created = created
+        self.updated = updated
+        self.summary = summary
+        self.link = link
+        self.parent_key = parent_key
+        self.due = due
+        self.priority_id = priority_id
+        self.duedate = duedate
+        self.updated_at = updated_at
+
+    # These methods return the line format with any vars expanded from the item itself
     def jira_line_title(self, line_fmt):
-        return line_fmt.format(**self.fields)
+        return line_fmt.render(self)
 
     def slack_line_title(self, line_fmt):
-        return f'<{self.fields["link"]}|{line_fmt.format(**self.fields)}>'
+        return f'<{self.link}|{line_fmt.render(self)}>'
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
 class Section():
-    def __init__(self, heading, line_items, line_fmt, message_if_none='', show_count=False):
+    def __init__(self, heading, line_items, line_fmt, message_if_none='', show_count=False, total=None):
+        self.name = None    # Key into COMPONENTS, set by whoever built the section
+        self.cursor = None  # When the data was fetched, used for incremental refreshes
+        self.as_of = None   # Set when this is older data standing in for a source that's down
         self.heading = heading
         self.line_items = line_items
+        self._fmt = _compile(line_fmt)
+        self.total = len(line_items) if total is None else total  # May exceed line_items if the source was capped
         self.line_fmt = line_fmt
         self.message_if_none = message_if_none
         self.show_count = show_count
+        self._rendered = {}
 
         print(f'Instantiated "{heading}"')
 
-    def get_section(self, for_slack=False, max_len=85):
-        title_count = f' ({len(self.line_items)})' if self.show_count else ''
+    def _lines(self, for_slack, max_len, marked=True):
+        title_count = f' ({self.total})' if self.show_count else ''
+        as_of = f' _(as of {self.as_of:%H:%M})_' if self.as_of and marked else ''
 
-        section_items = []
+        lines = []
 
         if self.heading:
-            section_items.append(f'*{self.heading}{title_count}:*')
+            lines.append(f'*{self.heading}{title_count}:*{as_of}')
 
-        section_items.append('\n\n')
+        lines.append('')
 
         if not self.line_items and self.message_if_none:
-            section_items.append(f'_{self.message_if_none}_')
-            section_items.append('\n')
+            lines.append(f'_{self.message_if_none}_')
 
         else:
             for li in self.line_items:
-                item_title = li.slack_line_title(self.line_fmt) if for_slack else li.jira_line_title(self.line_fmt)
-                section_items.append(item_title)
-                section_items.append('\n')
-                section_items.append(li.fields["summary"][:max_len])
-                section_items.append('\n\n')
+                item_title = li.slack_line_title(self._fmt) if for_slack else li.jira_line_title(self._fmt)
+                lines.append(item_title)
+                lines.append(li.summary[:max_len])
+                lines.append('')
+
+        return lines
+
+    # Sections don't change once built, so each output is rendered at most once per section.
+    # Jira markup and Slack mrkdwn only differ in how titles are linked.
+    def _render(self, target, max_len):
+        key = (target, max_len)
+        if key not in self._rendered:
+            metrics.inc('section_renders_total', section=self.name, target=target)
+            started = time.perf_counter()
+            if target == 'blocks':
+                self._rendered[key] = slack_interface.lines_to_blocks(self._lines(True, max_len))
+            else:
+                self._rendered[key] = '\n'.join(self._lines(target == 'slack', max_len)) + '\n'
+            metrics.observe('section_render_seconds', time.perf_counter() - started, section=self.name, target=target)
+        return self._rendered[key]
+
+    def jira_markup(self, max_len=85):
+        return self._render('jira', max_len)
 
-        return ''.join(section_items)
+    def slack_text(self, max_len=85):
+        return self._render('slack', max_len)
+
+    def blocks(self, max_len=85):
+        return self._render('blocks', max_len)
+
+    def get_section(self, for_slack=False, max_len=85):
+        return self.slack_text(max_len) if for_slack else self.jira_markup(max_len)
+
+    def fingerprint(self):
+        """Hash of the rendered section, anything that would show up differently changes it.
+
+        Except the "as of" marker, a section going stale without its content changing isn't news."""
+        if self.as_of:
+            return hashlib.sha1(('\n'.join(self._lines(False, 85, marked=False)) + '\n').encode()).hexdigest()
+        return hashlib.sha1(self.jira_markup().encode()).hexdigest()
+
+    def stale(self):
+        """Marks this (previously fetched) section as what its source looked like at the time, returns it"""
+        self.as_of = self.cursor
+        self._rendered = {}
+        return self
+
+    # Plain dicts so sections can be persisted and picked back up after a restart
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'cursor': self.cursor.strftime(_CURSOR_FMT) if self.cursor else None,
+            'heading': self.heading,
+            'line_items': [li.to_dict() for li in self.line_items],
+            'line_fmt': self.line_fmt,
+            'message_if_none': self.message_if_none,
+            'show_count': self.show_count,
+            'total': self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        section = cls(
+            heading=d['heading'],
+            line_items=[LineItem(**f) for f in d['line_items']],
+            line_fmt=d['line_fmt'],
+            message_if_none=d['message_if_none'],
+            show_count=d['show_count'],
+            total=d['total'])
+        section.name = d['name']
+        section.cursor = datetime.strptime(d['cursor'], _CURSOR_FMT) if d['cursor'] else None
+        return section
+
+
+def _due_label(duedate, today):
+    # Basic sanity check. If it's not set, don't try to parse it
+    if not duedate:
+        return 'UNSET'
+    if datetime.strptime(duedate, '%Y-%m-%d').date() == today:
+        return 'TODAY'
+    else:
+        return duedate
+
+
+def _jira_line_item(issue, today):
+    # Only the fields the component asked for come back, anything else is left blank
+    def _get(field):
+        return getattr(issue.fields, field, None) or ''
+
+    try:
+        parent_key = issue.fields.parent.key
+    except AttributeError:
+        parent_key = None
+
+    priority = getattr(issue.fields, 'priority', None)
+
+    return LineItem(  # Dates truncated to display only relevant/desireable date info
+        key=issue.key,
+        priority=priority.name if priority else None,
+        created=_get('created')[:10],
+        updated=_get('updated')[:16].replace('T', '_'),
+        summary=_get('summary'),
+        link=issue.permalink(),
+        parent_key=parent_key,
+        due=_due_label(_get('duedate'), today),
+        priority_id=int(priority.id) if priority else None,
+        duedate=_get('duedate'),
+        updated_at=_get('updated'),
+    )
+
+
+def _search_fields(fields, incremental):
+    if incremental:  # Needs a bit more to merge deltas later on
+        return list(set(fields or []) | set(_INCREMENTAL_FIELDS))
+    return fields
 
 
 class SecFromJira(Section):
-    def __init__(self, heading, query, line_fmt, only_followup=False, **kwargs):
+    def __init__(self, heading, query, line_fmt, only_followup=False, only_approaching=False,
+                 fields=None, max_results=None, cache_ttl=None, refresh=False, incremental=False, issues=None,
+                 **kwargs):
+        fetched_at = datetime.now(TZ)
         # No need to check this more than once per section (currently ony used for subtasks)
-        today = datetime.now(TZ).date()
-
-        def _check_due(issue):
-            # Basic sanity check. If it's not set, don't try to parse it
-            if not issue.fields.duedate:
-                return 'UNSET'
-            if datetime.strptime(issue.fields.duedate, '%Y-%m-%d').date() == today:
-                return 'TODAY'
-            else:
-                return issue.fields.duedate
-
-        def _get_parent_key(issue):
-            try:
-                parent_key = issue.fields.parent.key
-            except AttributeError:
-                parent_key = None
-            return parent_key
+        today = fetched_at.date()
 
-        issues = jira_interface.get_tickets(query)
+        planned = issues is not None  # i.e. the query planner already got them, in its own order
+        if not planned:
+            fields = _search_fields(fields, incremental)
+            issues = jira_interface.get_tickets(
+                query, fields=fields, limit=max_results, ttl=cache_ttl, refresh=refresh)
+        total = issues.total
 
         # Before using the list of issues, check if we want to filter based on "followup" or not
         if only_followup:
             issues = followup.filter_followup(issues)
+            total = len(issues)
+        elif only_approaching:
+            issues = followup.filter_approaching(issues)
+            total = len(issues)
 
         # print(f'Gathering line items for "{heading}"')
-        line_items = []
+        line_items = [_jira_line_item(issue, today) for issue in issues]
 
-        for issue in issues:
-            line_items.append(
-                LineItem(  # Dates truncated to display only relevant/desireable date info
-                    key=issue.key,
-                    priority=issue.fields.priority.name,
-                    created=issue.fields.created[:10],
-                    updated=issue.fields.updated[:16].replace('T', '_'),
-                    summary=issue.fields.summary,
-                    link=issue.permalink(),
-                    parent_key=_get_parent_key(issue),
-                    due=_check_due(issue)
-                )
-            )
+        if planned and not (only_followup or only_approaching):  # Those come sorted by urgency instead
+            _sort_items(line_items, _split_order(query)[1])
+            if max_results is not None:
+                del line_items[max_results:]
 
         super(SecFromJira, self).__init__(
             heading=heading,
             line_items=line_items,
             line_fmt=line_fmt,
+            total=total,
             **kwargs)
 
+        self.cursor = fetched_at
+
 
 class SecFromSlack(Section):
     _CHN_URL_BASE = 'https://birdrides.slack.com/archives/'  # No need to store this as a setting I think
 
     def __init__(self, heading, line_fmt, archived=False, **kwargs):
+        kwargs.pop('incremental', None)  # Channels are always listed in full
 
         # print(f'Gathering line items for "{heading}"')
         line_items = []
@@ -127,18 +283,339 @@ class SecFromSlack(Section):
             line_fmt=line_fmt,
             **kwargs)
 
+        self.cursor = datetime.now(TZ)
 
-def _instantiate(sec_comp):
-    if sec_comp['from_jira']:
-        return SecFromJira(**sec_comp['kwargs'])
-    else:
-        return SecFromSlack(**sec_comp['kwargs'])
 
+# Query planning.
+# Members of a QUERY_GROUPS group all get their issues out of the group's one search. Sections are built
+# concurrently, but the Jira cache collapses their identical group searches into a single call.
 
-def get_sections(name="full_ho"):
-    sections = []
-    if name == "full_ho":
-        sections.extend(_instantiate(s) for s in HO_COMPONENTS)
-    else:
-        sections.append(_instantiate(COMPONENTS[name]))
-    return sections
+_GROUP_OF = {name: group for group in QUERY_GROUPS.values() for name in group['members']}
+
+
+def _group_fields(group):
+    # Incremental members later merge deltas into what the group search got them, so it needs their fields too
+    incremental = any(COMPONENTS[member]['kwargs'].get('incremental') for member in group['members'])
+    return _search_fields(group['fields'], incremental)
+
+
+def group_query(name):
+    """JQL of the group search a component is served from, None if it runs its own"""
+    if FetchSettings.PLAN_QUERIES and name in _GROUP_OF:
+        return _GROUP_OF[name]['query']
+    return None
+
+
+def _matches(issue, where, now):
+    fields = issue.fields
+    if 'types' in where and fields.issuetype.name not in where['types']:
+        return False
+    if 'subtask' in where and bool(fields.issuetype.subtask) != where['subtask']:
+        return False
+    if 'priority' in where and (int(fields.priority.id) if fields.priority else None) != where['priority']:
+        return False
+    if 'status_not' in where and fields.status.name == where['status_not']:
+        return False
+    if 'created_within' in where and now - followup.epoch(fields.created) > where['created_within']:
+        return False
+    return True
+
+
+def _planned_issues(name):
+    group = _GROUP_OF[name]
+    kwargs = COMPONENTS[name]['kwargs']
+
+    issues = jira_interface.get_tickets(group['query'], fields=_group_fields(group), ttl=kwargs.get('cache_ttl'))
+    where = group['members'][name]
+    now = time.time()
+
+    return jira_interface.Results(issue for issue in issues if _matches(issue, where, now))
+
+
+def instantiate(name):
+    sec_comp = COMPONENTS[name]
+    with metrics.timer('section_fetch_seconds', section=name):
+        if sec_comp['from_jira'] and FetchSettings.PLAN_QUERIES and name in _GROUP_OF:
+            section = SecFromJira(issues=_planned_issues(name), **sec_comp['kwargs'])
+        elif sec_comp['from_jira']:
+            section = SecFromJira(**sec_comp['kwargs'])
+        else:
+            section = SecFromSlack(**sec_comp['kwargs'])
+    metrics.inc('section_line_items_total', len(section.line_items), section=name)
+    section.name = name
+    return section
+
+
+def _placeholder(name, reason):
+    # Stands in for a section whose source failed or took too long, so the rest of the handover still goes out
+    kwargs = COMPONENTS[name]['kwargs']
+    print(f'Could not fetch "{kwargs["heading"]}": {reason!r}')
+    section = Section(
+        heading=kwargs['heading'],
+        line_items=[],
+        line_fmt=kwargs['line_fmt'],
+        message_if_none=f'Unable to fetch this section right now ({type(reason).__name__}).')
+    section.name = name
+    return section
+
+
+def loading(name):
+    # Keeps a section's spot in a view that is still filling in
+    kwargs = COMPONENTS[name]['kwargs']
+    section = Section(heading=kwargs['heading'], line_items=[], line_fmt=kwargs['line_fmt'],
+                      message_if_none='Still fetching...')
+    section.name = name
+    return section
+
+
+def _fetch_all(names, build=instantiate, workers=None, timeout=None, on_section=None, fallback=None,
+               searches=None):
+    workers = workers or FetchSettings.WORKERS
+    timeout = timeout or FetchSettings.SECTION_TIMEOUT
+
+    # searches(name), if given, lists the Jira searches build(name) is about to make
+    if AsyncSettings.ENABLED and searches:
+        _prefetch(names, searches)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(build, n): i for i, n in enumerate(names)}
+
+    # Everything runs at once, so they all share the same budget. Results keep the order of names
+    # no matter what finishes first, on_section (if given) hears about each one as soon as it's done.
+    # A section that fails (or runs out of time) comes from fallback(name) if that has one, else a placeholder.
+    def failed(name, error):
+        metrics.inc('section_failures_total', section=name, error=type(error).__name__)
+        section = fallback(name) if fallback else None
+        return section if section is not None else _placeholder(name, error)
+
+    results = [None] * len(names)
+    try:
+        for fut in as_completed(futures, timeout=timeout):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = failed(names[i], e)
+            if on_section:
+                on_section(i, results[i])
+    except TimeoutError as e:
+        for i, name in enumerate(names):
+            if results[i] is None:
+                results[i] = failed(name, e)
+
+    # Don't hang around for stragglers, they'll finish (and be discarded) on their own
+    pool.shutdown(wait=False)
+    return results
+
+
+def _prefetch(names, searches):
+    # With the async backend every Jira search goes out at once up front, the sections then build from the cache
+    wanted = {}
+    for name in names:
+        for query, fields, limit, ttl in searches(name):
+            wanted.setdefault((query, tuple(sorted(fields or ())), limit), (query, fields, limit, ttl))
+    jira_interface.prefetch_many(list(wanted.values()))
+
+
+def jira_searches(name):
+    """The (query, fields, limit, ttl) searches instantiate(name) makes, none for Slack sections"""
+    comp = COMPONENTS[name]
+    if not comp['from_jira']:
+        return []
+    kwargs = comp['kwargs']
+    if group_query(name):  # Served from its group's search, see _planned_issues
+        group = _GROUP_OF[name]
+        return [(group['query'], _group_fields(group), None, kwargs.get('cache_ttl'))]
+    fields = _search_fields(kwargs.get('fields'), kwargs.get('incremental'))
+    return [(kwargs['query'], fields, kwargs.get('max_results'), kwargs.get('cache_ttl'))]
+
+
+def component_names(name):
+    return HO_COMPONENTS if name == "full_ho" else [name]
+
+
+def get_sections(name="full_ho", build=instantiate, on_section=None, searches=jira_searches):
+    """Builds the sections (all of the handover's by default), searches is what to prefetch for build"""
+    return _fetch_all(component_names(name), build=build, on_section=on_section, searches=searches)
+
+
+# Incremental refreshes.
+# Only components flagged "incremental" qualify, i.e. no relative dates ("-24h") and no followup
+# filtering, since those can drop issues that were never touched. Everything else is simply re-fetched.
+
+_INCREMENTAL_FIELDS = ['updated', 'priority', 'duedate', 'created']
+_ORDER_BY = re.compile(r'\s+ORDER\s+BY\s+', re.IGNORECASE)
+_CURSOR_MARGIN = timedelta(minutes=1)  # JQL dates only go down to the minute
+_PASS_TTL = FetchSettings.SECTION_TIMEOUT  # Prefetched counts and deltas only need to outlive the one pass
+
+# Local equivalents of the JQL "ORDER BY" fields we use, so merged items land where Jira would put them
+_SORT_KEYS = {
+    'key': lambda li: int(li.key.rsplit('-', 1)[-1]),
+    'priority': lambda li: -(li.priority_id or 99),  # Jira considers P1 the "highest"
+    'due': lambda li: li.duedate or '9999',  # Unset due dates go last
+    'duedate': lambda li: li.duedate or '9999',
+    'created': lambda li: li.created,
+    'updated': lambda li: li.updated_at,
+}
+
+
+def _split_order(query):
+    parts = _ORDER_BY.split(query, 1)
+
+    order = []
+    if len(parts) > 1:
+        for term in parts[1].split(','):
+            field, _, direction = term.strip().partition(' ')
+            order.append((field.lower(), direction.strip().upper() == 'DESC'))
+
+    return parts[0], order
+
+
+def _since(section):
+    # Assumes the Jira user's profile timezone matches TZ, which is how JQL interprets bare dates
+    return (section.cursor - _CURSOR_MARGIN).astimezone(TZ).strftime('%Y/%m/%d %H:%M')
+
+
+def only_changes_on_update(section):
+    """Whether a Jira section can only go stale by some issue being updated, which is what "incremental" vouches
+    for (issues age out of a relative date window, or a followup filter, without anyone touching them)"""
+    comp = COMPONENTS.get(section.name)
+    return bool(comp and comp['from_jira'] and section.cursor and comp['kwargs'].get('incremental'))
+
+
+def freshness_search(section):
+    """The count search behind is_unchanged, None if a count can't tell"""
+    if not only_changes_on_update(section) or len(section.line_items) > FetchSettings.MAX_JQL_KEYS:
+        return None
+
+    base, _ = _split_order(COMPONENTS[section.name]['kwargs']['query'])
+    clause = f'({base})'
+    if section.line_items:  # Catches issues that were updated right out of the query too
+        clause = f'({clause} OR key in ({", ".join(li.key for li in section.line_items)}))'
+
+    return (f'{clause} AND updated >= "{_since(section)}"', ['key'], 1, _PASS_TTL)
+
+
+def is_unchanged(section):
+    """Cheap check (a single count) for whether anything in, or formerly in, a Jira section was touched since it
+    was fetched"""
+    search = freshness_search(section)
+    if search is None:
+        return False
+
+    try:
+        return jira_interface.count(search[0]) == 0
+    except Exception as e:  # e.g. one of the keys got deleted, which is a change as far as we care
+        print(f'Freshness check for "{section.name}" failed: {e!r}')
+        return False
+
+
+def _sort_items(line_items, order):
+    for field, desc in reversed(order):  # Sort is stable, so apply the least significant key first
+        line_items.sort(key=_SORT_KEYS[field], reverse=desc)
+
+
+def _can_increment(name, previous):
+    kwargs = COMPONENTS[name]['kwargs']
+    if not (kwargs.get('incremental') and previous and previous.cursor):
+        return False
+    if len(previous.line_items) > FetchSettings.MAX_JQL_KEYS:  # The key list alone would make the URL too long
+        return False
+    _, order = _split_order(kwargs['query'])
+    return all(field in _SORT_KEYS for field, _ in order)
+
+
+def _delta_searches(name, previous):
+    # Anything new or changed that still belongs in the section, and (if it showed any) anything it showed
+    # that changed enough to fall out of it (closed, done, etc.)
+    kwargs = COMPONENTS[name]['kwargs']
+    base, _ = _split_order(kwargs['query'])
+    since = _since(previous)
+
+    searches = {'updated': (f'({base}) AND updated >= "{since}"',
+                            _search_fields(kwargs.get('fields'), True), None, _PASS_TTL)}
+    if previous.line_items:
+        keys = ', '.join(li.key for li in previous.line_items)
+        searches['touched'] = (f'key in ({keys}) AND updated >= "{since}"', ['updated'], None, _PASS_TTL)
+    return searches
+
+
+def _delta(search):
+    # Only a cache hit if prefetched for this pass, a delta is never worth keeping beyond it
+    query, fields, limit, _ = search
+    return jira_interface.get_tickets(query, fields=fields, limit=limit, ttl=0)
+
+
+def _refresh_incremental(name, previous):
+    kwargs = COMPONENTS[name]['kwargs']
+    fetched_at = datetime.now(TZ)
+    today = fetched_at.date()
+
+    _, order = _split_order(kwargs['query'])
+    searches = _delta_searches(name, previous)
+
+    updated = _delta(searches['updated'])
+    items = {li.key: li for li in previous.line_items}
+    touched = _delta(searches['touched']) if 'touched' in searches else []
+
+    still_matching = set()
+
+    for issue in updated:
+        still_matching.add(issue.key)
+        items[issue.key] = _jira_line_item(issue, today)
+
+    for issue in touched:
+        if issue.key not in still_matching:
+            items.pop(issue.key, None)
+
+    line_items = list(items.values())
+    for li in line_items:  # The "TODAY" label goes stale overnight
+        li.due = _due_label(li.duedate, today)
+
+    _sort_items(line_items, order)
+
+    section = Section(
+        heading=kwargs['heading'],
+        line_items=line_items,
+        line_fmt=kwargs['line_fmt'],
+        message_if_none=kwargs.get('message_if_none', ''),
+        show_count=kwargs.get('show_count', False))
+    section.name = name
+    section.cursor = fetched_at
+
+    return section
+
+
+def refresh_sections(previous):
+    """Brings a previously fetched set of sections up to date.
+
+    Returns the new sections, in the same order. Whether any of them changed is up to the caller
+    (jobs compares fingerprints). A section that can't be refreshed, for whatever reason, stays as it
+    was (marked stale), so a failed fetch never replaces good content or shows up as a change."""
+    by_name = {s.name: s for s in previous}
+    names = [s.name for s in previous]
+
+    def _refresh(name):
+        prev = by_name[name]
+
+        if _can_increment(name, prev):
+            try:
+                with metrics.timer('section_fetch_seconds', section=name, mode='incremental'):
+                    return _refresh_incremental(name, prev)
+            except Exception as e:  # e.g. one of the known keys got deleted, just start over
+                print(f'Incremental refresh of "{name}" failed, doing a full one: {e!r}')
+
+        return instantiate(name)
+
+    def _previous(name):
+        prev = by_name[name]
+        if prev.cursor is None:  # A placeholder itself, nothing good to fall back on
+            return None
+        print(f'Keeping the previous "{name}" from {prev.cursor:%H:%M}')
+        return prev.stale()
+
+    def _searches(name):
+        prev = by_name[name]
+        return list(_delta_searches(name, prev).values()) if _can_increment(name, prev) else jira_searches(name)
+
+    return _fetch_all(names, build=_refresh, fallback=_previous, searches=_searches)
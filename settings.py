@@ -12,17 +12,85 @@ class JiraSettings:
     USER = os.environ.get('JIRA_USER')
     TOKEN = os.environ.get('JIRA_TOKEN')
 
-    URL = 'https://birdco.atlassian.net/'
+    URL = os.environ.get('JIRA_URL', 'https://birdco.atlassian.net/')  # Overridable for the local fakes in bench/
     PROJECT = 'NP' if DEBUG else 'NOC'
 
+    # Shared secret on the Jira webhook URL (/jira-webhook?secret=...), the webhook is refused if unset
+    WEBHOOK_SECRET = os.environ.get('JIRA_WEBHOOK_SECRET')
+
+    PAGE_SIZE = 100  # Jira Cloud won't hand out more than this per search request anyway
+    TIMEOUT = 30     # Seconds any one Jira request may take, so an unresponsive Jira can't hang a job
+    FIELDS = ['priority', 'created', 'updated', 'summary', 'parent', 'duedate']  # Used when a component doesn't say
+
 
 class SlackSettings:
-    WHOOK = os.environ.get('DEV_WHOOK') if DEBUG else os.environ.get('HANDOVER_WHOOK')
+    WHOOK = os.environ.get('DEV_WHOOK') if DEBUG else os.environ.get('HANDOVER_WHOOK')  # Checked when posting
+
+    TOKEN = os.environ.get('SLACK_DEV_TOKEN') if DEBUG else os.environ.get('SLACK_TOKEN')
+
+    API_URL = os.environ.get('SLACK_API_URL', 'https://slack.com/api/')
+
+    # Shared HTTP transport for everything Slack
+    TIMEOUT = (3.05, 10)  # Connect, read
+    RETRIES = 4
+    BACKOFF = 1           # Seconds, doubled every retry...
+    MAX_BACKOFF = 30      # ...up to this (also caps Retry-After)
+    RATE_LIMITS = {       # Minimum seconds between calls, roughly Slack's published tiers
+        'webhook': 1.0,
+        'channels.list': 3.0,
+        'users.info': 0.6,
+    }
+
+    # Local index of NOC channels, shared (via disk) between the scheduler and noc_status
+    CHANNEL_INDEX = os.environ.get('CHANNEL_INDEX', 'channel_index.json')
+    CHANNEL_INDEX_MAX_AGE = 900  # Seconds before a full re-scan happens in the background
+
+
+class AsyncSettings:
+    ENABLED = False   # Send Jira searches and Slack API calls through the asyncio (aiohttp) backend
+    POOL_SIZE = 20    # Open connections per upstream
+    TIMEOUT = 30      # Seconds for any single request
+
+
+class FetchSettings:
+    WORKERS = 6             # One per HO component is plenty
+    SECTION_TIMEOUT = 60    # Seconds to wait on any single section before giving up on it
+    PLAN_QUERIES = True     # Serve components in QUERY_GROUPS from one shared search per group
+    MAX_JQL_KEYS = 100      # Longest "key in (...)" list to put in a search URL, bigger sections get fully re-fetched
+
 
-    if WHOOK is None:  # Meaning the environment variable is not set!
-        raise Exception('Missing webhook for Slack!')
+class SchedulerSettings:
+    WORKERS = 4           # Jobs that can run at the same time (never two runs of the same job though)
+    MISFIRE_GRACE = 600   # Seconds late a run can still start, e.g. after a slow job held a worker
+    COALESCE = True       # Several missed runs of a job only run once
 
-    TOKEN = os.environ['SLACK_DEV_TOKEN'] if DEBUG else os.environ.get('SLACK_TOKEN')
+
+class SnapshotSettings:
+    PREFETCH_LEAD = 5  # Minutes before each handover that sections get warmed up
+    MAX_AGE = 900      # Seconds a snapshot section can be served (after a freshness check) before a full re-fetch
+
+    # With the Jira webhook set up (which takes its secret), snapshots are invalidated on every change, so the
+    # per-request freshness check can be skipped (only for incremental sections, and still bounded by MAX_AGE)
+    TRUST_WEBHOOKS = bool(JiraSettings.WEBHOOK_SECRET)
+
+
+class StateSettings:
+    PATH = os.environ.get('NOC_NEWS_STATE', 'noc_news.db')
+
+
+class BreakerSettings:
+    FAILURES = 3      # Failed calls in a row after which an upstream is considered down
+    RETRY_AFTER = 30  # Seconds between background probes while it's down
+
+
+class ArchiveSettings:
+    PATH = StateSettings.PATH  # Past handovers live next to the rest of the state
+    MAX_RESULTS = 25           # Line items shown per search
+
+
+class CacheSettings:
+    TTL = 60             # Seconds a Jira result stays fresh unless a component says otherwise
+    MAX_ISSUES = 5000    # Total issues held across all cached queries before LRU eviction kicks in
 
 
 class Intervals:
@@ -30,9 +98,21 @@ class Intervals:
     P3 = 86400     # 24 HRS
     P4 = 604800    # 1 Week
 
+    # Follow-up thresholds keyed by priority id, priorities left out are never flagged
+    BY_PRIORITY = {2: P2, 3: P3, 4: P4}
+    WARN_AT = 0.75  # Fraction of the threshold after which an issue counts as approaching it
+
 
 class NOCStatSettings:
-    SIGN_SECRET = os.environ['SLACK_SIGN_SECRET'].encode()  # MUST BE ASCII ¯\_(ツ)_/¯
+    SIGN_SECRET = os.environ.get('SLACK_SIGN_SECRET', '').encode()  # MUST BE ASCII ¯\_(ツ)_/¯
+    OPS_SECRET = os.environ.get('NOC_STATUS_OPS_SECRET')  # ?secret= for /job-runs and /health, closed if unset
+    MAX_REQUEST_AGE = 300       # Seconds, Slack's own recommendation for rejecting replays
+    REPLAY_CACHE_SIZE = 10000   # Signatures remembered to catch replays within that window
+
+    RENDER_WORKERS = 4       # Views being put together at once
+    RENDER_QUEUE_DEPTH = 10  # Distinct selections allowed to wait before new clicks get turned away
+    PROGRESSIVE = True       # Show every section in the view as soon as it's fetched, instead of all at the end
+    UPDATE_INTERVAL = 1.0    # Seconds between views.update calls for one render, updates in between are coalesced
     AUTHORIZED_USERS = [
         'josh.martinez', 'barry.mayo', 'chris.bosman', 'chris.andrews', 'derek.gaska',
         'rosalba.vergara', 'anthony.vaccaro', 'zachary.thacker', 'minuk.kim']
@@ -50,6 +130,10 @@ class NOCStatSettings:
             "text": "Follow-up Issues (per SLAs)",
             "value": "followup_issues"
         },
+        {
+            "text": "Nearing Follow-up (per SLAs)",
+            "value": "approaching_followup"
+        },
         {
             "text": "Issue Subtasks",
             "value": "incident_subtasks"
@@ -70,6 +154,10 @@ class NOCStatSettings:
             "text": "Archived NOC Channels",
             "value": "archived_channs"
         },
+        {
+            "text": "Search Past Handovers",
+            "value": "archive_search"
+        },
     ]
 
 
@@ -95,6 +183,13 @@ _LONG_FMT = '*{key} — P{priority} — Last update: {updated}*'
 _SUBT_FMT = '*{key} — Parent: {parent_key} — Due: {due}*'
 _ACCITEMS_FMT = '*{key} — Due: {due}*'
 
+# Jira fields each format actually needs (key always comes back regardless)
+_SHORT_FIELDS = ['created', 'summary']
+# The extras are for incremental refreshes, and keep followup_issues on the same cache entry as outstanding_incidents
+_LONG_FIELDS = ['priority', 'updated', 'summary', 'created', 'duedate']
+_SUBT_FIELDS = ['parent', 'duedate', 'summary']
+_ACCITEMS_FIELDS = ['duedate', 'summary']
+
 
 COMPONENTS = {
     "open_ho_issues": {
@@ -104,6 +199,8 @@ COMPONENTS = {
             "query": _HO,
             "message_if_none": "No open handover issues.",
             "line_fmt": _SHORT_FMT,
+            "fields": _SHORT_FIELDS,
+            "incremental": True,
         }
     },
     "recent_cr_issues": {
@@ -113,6 +210,7 @@ COMPONENTS = {
             "query": _CR,
             "message_if_none": "No recent CR issues.",
             "line_fmt": _SHORT_FMT,
+            "fields": _SHORT_FIELDS,
         }
     },
     "recent_outages": {
@@ -122,6 +220,7 @@ COMPONENTS = {
             "query": _P1,
             "message_if_none": "No recent outages (knock on wood).",
             "line_fmt": _LONG_FMT,
+            "fields": _LONG_FIELDS,
         }
     },
     "outstanding_incidents": {
@@ -131,7 +230,9 @@ COMPONENTS = {
             "query": _OPEN_ISSUES,
             "message_if_none": "No outstanding incidents. Woohoo!",
             "line_fmt": _LONG_FMT,
+            "fields": _LONG_FIELDS,
             "show_count": True,
+            "incremental": True,
         }
     },
     "incident_subtasks": {
@@ -141,6 +242,8 @@ COMPONENTS = {
             "query": _SUBTASKS,
             "message_if_none": "No pending sub-tasks.",
             "line_fmt": _SUBT_FMT,
+            "fields": _SUBT_FIELDS,
+            "incremental": True,
         }
     },
     "open_channs": {
@@ -160,10 +263,23 @@ COMPONENTS = {
             "query": _OPEN_ISSUES,
             "message_if_none": "No issues need to be followed up on right now.",
             "line_fmt": _LONG_FMT,
+            "fields": _LONG_FIELDS,
             "show_count": True,
             "only_followup": True,
         }
     },
+    "approaching_followup": {
+        "from_jira": True,
+        "kwargs": {
+            "heading": "Issues nearing follow-up",
+            "query": _OPEN_ISSUES,
+            "message_if_none": "Nothing is close to needing a follow-up.",
+            "line_fmt": _LONG_FMT,
+            "fields": _LONG_FIELDS,
+            "show_count": True,
+            "only_approaching": True,
+        }
+    },
 
 
     # Exclusively on-demand components
@@ -174,6 +290,7 @@ COMPONENTS = {
             "query": _ACCITEMS,
             "message_if_none": "No action items found.",
             "line_fmt": _ACCITEMS_FMT,
+            "fields": _ACCITEMS_FIELDS,
         }
     },
     "archived_channs": {
@@ -191,16 +308,63 @@ COMPONENTS = {
             "query": _RECENT_P1S,
             "message_if_none": "This should not be empty!",
             "line_fmt": _SHORT_FMT,
+            "fields": _SHORT_FIELDS,
+            "max_results": 100,  # Unbounded otherwise, nobody scrolls that far
+            "cache_ttl": 300,  # Historical, barely moves
         }
     },
 }
 
+# Issue types each Jira component draws from, used to work out which sections a Jira webhook event touches
+_TYPE_NAMES = ['Incident', 'Platform Partner Outage']
+COMPONENT_ISSUE_TYPES = {
+    "open_ho_issues": ['Story'],
+    "recent_cr_issues": ['Change Record'],
+    "recent_outages": _TYPE_NAMES,
+    "outstanding_incidents": _TYPE_NAMES,
+    "incident_subtasks": ['Sub-task'],
+    "followup_issues": _TYPE_NAMES,
+    "approaching_followup": _TYPE_NAMES,
+    "action_items": ['NOC Action Item'],
+    "recent_p1s": _TYPE_NAMES,
+}
+
+# Components that overlap enough to be served from one wider search per group. Each member keeps a
+# client-side predicate that tells its issues apart from the rest of the group (the group JQL already
+# guarantees the rest of the member's own conditions), plus its own ORDER BY which is applied locally.
+# Predicate keys: types (issue type names), subtask, priority (id, like followup), status_not, created_within.
+QUERY_GROUPS = {
+    "noc_incidents": {
+        "query": f'project = NOC AND {_TYPES} AND (status != Closed OR (priority = 1 AND created > "-36h")) '
+                 f'{_DEF_SORT}',
+        "fields": ['status', 'issuetype'] + _LONG_FIELDS,
+        "members": {
+            "recent_outages": {"priority": 1, "created_within": 36 * 3600},
+            "outstanding_incidents": {"status_not": 'Closed'},
+            "followup_issues": {"status_not": 'Closed'},
+            "approaching_followup": {"status_not": 'Closed'},
+        },
+    },
+    "noc_tracking": {
+        "query": 'project = NOC AND ('
+                 '(type = Story AND summary ~ "NOC Handover" AND status != Done) OR '
+                 '(type = "Change Record" AND created > "-24h") OR '
+                 f'(issuetype = sub-task AND status != Done)) {_DEF_SORT}',
+        "fields": ['status', 'issuetype'] + _SHORT_FIELDS + _SUBT_FIELDS,
+        "members": {
+            "open_ho_issues": {"types": ['Story']},
+            "recent_cr_issues": {"types": ['Change Record']},
+            "incident_subtasks": {"subtask": True},
+        },
+    },
+}
+
 # This defines the entirety of components and their order for the full handover message
 HO_COMPONENTS = [
-    COMPONENTS["open_ho_issues"],
-    COMPONENTS["recent_cr_issues"],
-    COMPONENTS["recent_outages"],
-    COMPONENTS["outstanding_incidents"],
-    COMPONENTS["incident_subtasks"],
-    COMPONENTS["open_channs"]
+    "open_ho_issues",
+    "recent_cr_issues",
+    "recent_outages",
+    "outstanding_incidents",
+    "incident_subtasks",
+    "open_channs",
 ]
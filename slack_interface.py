@@ -1,9 +1,86 @@
-from settings import SlackSettings
-import requests
-import slack
+from settings import SlackSettings, AsyncSettings, BreakerSettings
+from breaker import CircuitBreaker
+from transport import Transport
+from threading import Lock, Thread
+import metrics
 import json
+import time
+import aio
+import os
 
-client = slack.WebClient(token=SlackSettings.TOKEN)
+transport = Transport(
+    timeout=SlackSettings.TIMEOUT,
+    retries=SlackSettings.RETRIES,
+    backoff=SlackSettings.BACKOFF,
+    max_backoff=SlackSettings.MAX_BACKOFF,
+    rate_limits=SlackSettings.RATE_LIMITS)
+
+
+class SlackApiError(Exception):
+    pass
+
+
+class WebAPI():
+    """Stands in for slack.WebClient (client.views_update(...) etc.), but over the shared pooled transport"""
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url
+
+    @staticmethod
+    def _form(payload):
+        # Form encoding works for every method (read ones don't take JSON bodies), nested values go as JSON strings
+        return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in payload.items()}
+
+    @staticmethod
+    def _check(method, data):
+        if not data.get('ok'):
+            raise SlackApiError(f'{method} failed: {data.get("error")}')
+        return data
+
+    def api_call(self, method, **payload):
+        if AsyncSettings.ENABLED:
+            return aio.run(self.api_call_async(method, **payload))
+
+        # Reads and views.* calls only, safe to repeat (a repeated views.open just fails on the used trigger_id)
+        with metrics.timer('slack_request_seconds', call=method):
+            response = transport.post(
+                f'{self.base_url}{method}',
+                endpoint=method,
+                headers={'Authorization': f'Bearer {self.token}'},
+                data=self._form(payload),
+                idempotent=True)
+
+        metrics.inc('slack_requests_total', call=method)
+        metrics.inc('slack_response_bytes_total', len(response.content), call=method)
+        return self._check(method, response.json())
+
+    async def api_call_async(self, method, **payload):
+        form = self._form(payload)
+        started = time.perf_counter()
+        # Through the shared transport's rate limits and retries, same as api_call
+        status, body = await transport.request_async(lambda: aio.slack_post(method, form), method, idempotent=True)
+        metrics.observe('slack_request_seconds', time.perf_counter() - started, call=method)
+        metrics.inc('slack_requests_total', call=method)
+        metrics.inc('slack_response_bytes_total', len(body), call=method)
+        return self._check(method, json.loads(body))
+
+    def __getattr__(self, name):
+        method = name.replace('_', '.')  # views_update -> views.update
+        return lambda **payload: self.api_call(method, **payload)
+
+
+client = WebAPI(SlackSettings.TOKEN, SlackSettings.API_URL)
+
+
+def probe():
+    """Health check, actually talks to Slack (unlike importing this module)"""
+    return client.auth_test()['team']
+
+
+# Only guards the channel listing, posting has nothing to fall back to (and the transport already retries it)
+breaker = CircuitBreaker(
+    'slack', probe=probe, failures=BreakerSettings.FAILURES, retry_after=BreakerSettings.RETRY_AFTER)
 
 
 def _chan_is_relevant(c, archived):
@@ -13,20 +90,138 @@ def _chan_is_relevant(c, archived):
     return all((kw_test, arch_test))
 
 
-def get_channels(archived):
-    relevant_channels = []
+def _chan_is_noc(c):
+    return _chan_is_relevant(c, c['is_archived'])
+
+
+def _scan_channels():
+    noc_channels = []
 
     cursor = ''  # Think I tried using None/null and it didn't like that
     while True:  # This has to run with a empty cursor the first time
         response = client.channels_list(cursor=cursor)
 
-        filtered_page = (c for c in response['channels'] if _chan_is_relevant(c, archived))
-        relevant_channels.extend(filtered_page)
+        noc_channels.extend(c for c in response['channels'] if _chan_is_noc(c))
 
         cursor = response['response_metadata']['next_cursor']
         if not cursor:
             break
 
+    return noc_channels
+
+
+class _ChannelIndex():
+    """NOC channels (open and archived) kept locally so sections don't have to walk the whole workspace.
+
+    One full scan fills it, after which it's re-scanned in the background once it gets old and patched
+    in between by channel events. It's persisted to disk so the scheduler and noc_status share it."""
+
+    # Only what the sections actually use
+    _KEEP = ('id', 'name', 'created', 'is_archived', 'topic')
+
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self._channels = {}  # id -> channel
+        self._scanned_at = 0
+        self._loaded_mtime = 0
+        self._scanning = False
+        self._lock = Lock()
+        self._scan_lock = Lock()  # Only for the very first scan, so concurrent sections don't each do one
+
+    def _slim(self, c):
+        return {k: c[k] for k in self._KEEP if k in c}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime <= self._loaded_mtime:
+                return
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):  # Nothing on disk yet (or garbage), a scan will sort it out
+            return
+
+        self._channels = {c['id']: c for c in stored['channels']}
+        self._scanned_at = stored['scanned_at']
+        self._loaded_mtime = mtime
+
+    def _save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'scanned_at': self._scanned_at, 'channels': list(self._channels.values())}, f)
+        os.replace(tmp, self.path)  # Atomic, the other process never sees half a file
+        self._loaded_mtime = os.path.getmtime(self.path)
+
+    def scan(self):
+        metrics.inc('channel_index_scans_total')
+        channels = breaker.call(_scan_channels)
+        with self._lock:
+            self._channels = {c['id']: self._slim(c) for c in channels}
+            self._scanned_at = time.time()
+            self._scanning = False
+            self._save()
+
+    def _background_scan(self):
+        try:
+            self.scan()
+        except Exception as e:
+            print(f'Channel index refresh failed: {e!r}')
+            with self._lock:
+                self._scanning = False
+
+    def channels(self, archived):
+        with self._lock:
+            self._load()
+            empty = not self._scanned_at
+            stale = time.time() - self._scanned_at > self.max_age
+            if stale and not empty and not self._scanning and not breaker.is_open:
+                self._scanning = True
+                Thread(target=self._background_scan, daemon=True).start()
+
+        if empty:  # Nothing to serve yet, so this one time we wait for it
+            with self._scan_lock:
+                if not self._scanned_at:
+                    self.scan()
+
+        with self._lock:
+            return [c for c in self._channels.values() if bool(c['is_archived']) == archived]
+
+    def apply_event(self, event):
+        """Patches the index from a Slack channel_* event. Returns True if anything changed."""
+        kind = event.get('type')
+        chan = event.get('channel')
+
+        with self._lock:
+            self._load()
+
+            if kind in ('channel_created', 'channel_rename'):
+                known = self._channels.get(chan['id'], {'topic': {'value': ''}, 'is_archived': False})
+                known.update(self._slim(chan))
+                if _chan_is_noc(known):
+                    self._channels[chan['id']] = known
+                elif self._channels.pop(chan['id'], None) is None:
+                    return False
+
+            elif kind in ('channel_archive', 'channel_unarchive') and chan in self._channels:
+                self._channels[chan]['is_archived'] = kind == 'channel_archive'
+
+            elif kind == 'channel_deleted' and chan in self._channels:
+                del self._channels[chan]
+
+            else:
+                return False
+
+            self._save()
+            return True
+
+
+channel_index = _ChannelIndex(SlackSettings.CHANNEL_INDEX, SlackSettings.CHANNEL_INDEX_MAX_AGE)
+breaker.on_recover(channel_index.scan)
+
+
+def get_channels(archived):
+    relevant_channels = channel_index.channels(archived)
     relevant_channels.sort(key=lambda chan: chan['created'], reverse=True)
 
     return relevant_channels
@@ -38,6 +233,12 @@ def get_user_name(usr):
     return response['user']['name']
 
 
+# Slack's own limits
+MAX_BLOCK_CHARS = 3000
+MAX_MSG_BLOCKS = 50
+MAX_VIEW_BLOCKS = 100  # Modals get more room than messages
+
+
 def _txt_block(text):
     return {
         "type": "section",
@@ -48,18 +249,33 @@ def _txt_block(text):
     }
 
 
+def _wrap(line, width):
+    # A single line over the block limit has no choice but to be chopped up
+    return [line[i:i + width] for i in range(0, len(line), width)] or ['']
+
+
 def block_builder(section):
+    return lines_to_blocks(section.splitlines())
+
+
+def lines_to_blocks(lines):
     blocks = []
     block_lines = []
+    size = 0  # Always equal to len('\n'.join(block_lines)), kept as we go so this stays linear
+
+    for long_line in lines:
+        for line in _wrap(long_line, MAX_BLOCK_CHARS):
+            added = len(line) + 1 if block_lines else len(line)  # Counting the newline that joins it
 
-    for line in section.splitlines():
-        # If the total char length will not exceed 3k, keep appending lines
-        if len('\n'.join(block_lines)) + len(line) < 3000:
-            block_lines.append(line)
-        # Else reset block_lines list and append to blocks immediately
-        else:
-            blocks.append(_txt_block('\n'.join(block_lines)))
-            block_lines = [line]
+            # If the total char length will not exceed 3k, keep appending lines
+            if size + added <= MAX_BLOCK_CHARS:
+                block_lines.append(line)
+                size += added
+            # Else reset block_lines list and append to blocks immediately
+            else:
+                blocks.append(_txt_block('\n'.join(block_lines)))
+                block_lines = [line]
+                size = len(line)
 
     # Append any left over lines
     if block_lines:
@@ -68,21 +284,69 @@ def block_builder(section):
     return blocks
 
 
-def msg_builder(*segments):
+def join_blocks(*block_lists):
     blocks = []
 
-    for segment in segments:
-        blocks.extend(block_builder(segment))
+    for i, block_list in enumerate(block_lists):
+        blocks.extend(block_list)
 
-        if segment != segments[-1]:  # Don't add line for last (or only) segment
+        if i < len(block_lists) - 1:  # Don't add line for last (or only) segment
             blocks.append({"type": "divider"})
     return blocks
 
 
+def msg_builder(*segments):
+    return join_blocks(*[block_builder(segment) for segment in segments])
+
+
+def paginate(blocks, max_blocks=MAX_MSG_BLOCKS):
+    """Splits blocks into pages of at most max_blocks, without leaving dividers at either end of a page"""
+    pages = []
+    page = []
+
+    for block in blocks:
+        if block['type'] == 'divider' and not page:
+            continue
+        page.append(block)
+        if len(page) == max_blocks:
+            pages.append(page)
+            page = []
+
+    if page:
+        pages.append(page)
+
+    for page in pages:
+        if page[-1]['type'] == 'divider':
+            page.pop()
+
+    return [p for p in pages if p]
+
+
+def fit_view(blocks, max_blocks=MAX_VIEW_BLOCKS):
+    """Views can't be split across messages, so anything beyond the limit gets cut with a note"""
+    if len(blocks) <= max_blocks:
+        return blocks
+
+    kept = paginate(blocks, max_blocks - 1)[0]
+    kept.append(_txt_block(f'_...and more, {len(blocks) - len(kept)} blocks cut to fit Slack\'s limits._'))
+    return kept
+
+
 def send_msg(*segments):
     """Accepts any number of message segments"""
+    send_blocks(msg_builder(*segments))
+
+
+def send_blocks(blocks):
+    """Posts already built blocks, split over several posts if Slack won't take them as one"""
+    if SlackSettings.WHOOK is None:  # Meaning the environment variable is not set!
+        raise Exception('Missing webhook for Slack!')
 
-    msg = {"blocks": msg_builder(*segments)}
+    for page in paginate(blocks):
+        msg = json.dumps({"blocks": page})
 
-    response = requests.post(SlackSettings.WHOOK, data=json.dumps(msg))
-    print(response.status_code)
+        with metrics.timer('slack_request_seconds', call='webhook'):
+            response = transport.post(SlackSettings.WHOOK, endpoint='webhook', data=msg)
+        metrics.inc('slack_requests_total', call='webhook')
+        metrics.inc('slack_request_bytes_total', len(msg), call='webhook')
+        print(response.status_code)
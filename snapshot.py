@@ -0,0 +1,135 @@
+from settings import TZ, SnapshotSettings, JiraSettings, COMPONENTS, COMPONENT_ISSUE_TYPES
+from datetime import datetime
+from state import store
+import jira_interface
+import slack_interface
+import sections
+import breaker
+import metrics
+
+
+def _key(name):
+    return f'snapshot:{name}'
+
+
+def save(secs):
+    for section in secs:
+        if section.cursor:  # Placeholders for failed fetches are not worth keeping
+            store.set(_key(section.name), section.to_dict())
+
+
+def load(name, max_age=None):
+    max_age = SnapshotSettings.MAX_AGE if max_age is None else max_age
+
+    saved = store.get(_key(name))
+    if not saved:
+        return None
+
+    section = sections.Section.from_dict(saved)
+    if (datetime.now(TZ) - section.cursor).total_seconds() > max_age:
+        return None
+    return section
+
+
+def _is_current(section):
+    if SnapshotSettings.TRUST_WEBHOOKS:  # Anything that changed would have been invalidated already
+        return sections.only_changes_on_update(section)
+    return sections.is_unchanged(section)
+
+
+def _stale(name):
+    # Whatever we last got, however old, still beats an empty section while the source is down
+    section = load(name, max_age=float('inf'))
+    if section is None:
+        return None
+    print(f'Serving "{name}" from a snapshot as of {section.cursor:%H:%M}, its source is down')
+    metrics.inc('snapshot_total', result='stale', section=name)
+    return section.stale()
+
+
+def _warm(name):
+    try:
+        section = load(name)
+        if section and _is_current(section):
+            print(f'Serving "{name}" from snapshot')
+            metrics.inc('snapshot_total', result='hit', section=name)
+            return section
+
+        metrics.inc('snapshot_total', result='miss', section=name)
+        section = sections.instantiate(name)
+    except breaker.CircuitOpen:
+        section = _stale(name)
+        if section is None:
+            raise
+        return section
+
+    save([section])
+    return section
+
+
+def _searches(name):
+    # What _warm(name) is going to ask Jira: only the freshness count when there's a snapshot to check
+    section = load(name)
+    if section is None:
+        return sections.jira_searches(name)
+    if SnapshotSettings.TRUST_WEBHOOKS:
+        return [] if sections.only_changes_on_update(section) else sections.jira_searches(name)
+    check = sections.freshness_search(section)
+    return [check] if check else sections.jira_searches(name)
+
+
+def warm_sections(name="full_ho", on_section=None):
+    """Like sections.get_sections, but serves anything that hasn't changed from the shared snapshot"""
+    return sections.get_sections(name, build=_warm, on_section=on_section, searches=_searches)
+
+
+def prefetch(name="full_ho"):
+    # Goes through the warm path too, so a snapshot that is still good doesn't get re-fetched for nothing
+    warm_sections(name)
+
+
+# Once an upstream is back, bring the snapshot up to date right away rather than on the next request
+jira_interface.breaker.on_recover(prefetch)
+slack_interface.breaker.on_recover(prefetch)
+
+
+def apply_jira_event(event):
+    """Patches or invalidates the sections a Jira issue webhook event touches. Returns their names.
+
+    Deleted issues are simply dropped from any snapshot showing them. For anything else the affected
+    sections are invalidated, since working out whether the issue still matches their JQL is Jira's job."""
+    kind = event.get('webhookEvent', '')
+    issue = event.get('issue') or {}
+    fields = issue.get('fields') or {}
+
+    if not issue.get('key') or (fields.get('project') or {}).get('key', JiraSettings.PROJECT) != JiraSettings.PROJECT:
+        return []
+
+    issue_type = (fields.get('issuetype') or {}).get('name')
+    affected = []
+
+    for name, comp in COMPONENTS.items():
+        if not comp['from_jira']:
+            continue
+
+        saved = store.get(_key(name))
+        shown = bool(saved) and any(li['key'] == issue['key'] for li in saved['line_items'])
+        if not shown and issue_type not in COMPONENT_ISSUE_TYPES.get(name, ()):
+            continue
+
+        affected.append(name)
+        jira_interface.cache.invalidate(comp['kwargs']['query'])
+        if sections.group_query(name):  # Planned members are served from their group's search
+            jira_interface.cache.invalidate(sections.group_query(name))
+
+        if not saved:
+            continue
+        if kind == 'jira:issue_deleted':
+            saved['line_items'] = [li for li in saved['line_items'] if li['key'] != issue['key']]
+            saved['total'] = max(saved['total'] - shown, 0)
+            store.set(_key(name), saved)
+        else:
+            store.delete(_key(name))
+
+    metrics.inc('jira_webhook_events_total', event=kind or 'unknown')
+    return affected
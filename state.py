@@ -0,0 +1,62 @@
+from settings import StateSettings
+import sqlite3
+import json
+import time
+
+
+class StateStore():
+    """Tiny durable key/value store (SQLite, JSON values) for anything that needs to survive a restart"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')  # Lets noc_status read while the scheduler writes
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_runs ('
+                'job_id TEXT NOT NULL, started_at REAL NOT NULL, duration REAL, outcome TEXT NOT NULL, detail TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS job_runs_by_job ON job_runs (job_id, started_at)')
+
+    def _connect(self):
+        # A connection per call keeps this safe to use from any thread, and SQLite opens are cheap
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (key, value, updated_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time()))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def record_run(self, job_id, started_at, duration, outcome, detail=None):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO job_runs (job_id, started_at, duration, outcome, detail) VALUES (?, ?, ?, ?, ?)',
+                (job_id, started_at, duration, outcome, detail))
+
+    def job_runs(self, job_id=None, limit=50):
+        """Most recent runs first, optionally just for one job"""
+        query = 'SELECT job_id, started_at, duration, outcome, detail FROM job_runs'
+        params = ()
+        if job_id:
+            query += ' WHERE job_id = ?'
+            params = (job_id,)
+        query += ' ORDER BY started_at DESC LIMIT ?'
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params + (limit,)).fetchall()
+
+        keys = ('job_id', 'started_at', 'duration', 'outcome', 'detail')
+        return [dict(zip(keys, row)) for row in rows]
+
+
+store = StateStore(StateSettings.PATH)
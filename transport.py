@@ -0,0 +1,151 @@
+from requests.adapters import HTTPAdapter
+from threading import Lock
+import requests
+import asyncio
+import metrics
+import time
+
+
+class TransportError(Exception):
+    pass
+
+
+class RateLimiter():
+    """Keeps calls to each endpoint at least `interval` seconds apart (across threads)"""
+
+    def __init__(self, intervals, default=0.0):
+        self.intervals = intervals
+        self.default = default
+        self._next_slot = {}
+        self._lock = Lock()
+
+    def reserve(self, endpoint):
+        """Takes the next free slot for endpoint, returns how many seconds until it comes up"""
+        interval = self.intervals.get(endpoint, self.default)
+        if not interval:
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(endpoint, 0))
+            self._next_slot[endpoint] = slot + interval
+        return slot - now
+
+    def wait(self, endpoint):
+        delay = self.reserve(endpoint)  # Sleeps outside the lock
+        if delay > 0:
+            time.sleep(delay)
+
+    def hold(self, endpoint, seconds):
+        # Upstream told us to back off (Retry-After), nobody else gets to call it before then either
+        with self._lock:
+            self._next_slot[endpoint] = max(self._next_slot.get(endpoint, 0), time.monotonic() + seconds)
+
+
+class Transport():
+    """Pooled HTTP session with timeouts, retries (exponential backoff, honoring Retry-After) and
+    per-endpoint rate limiting. Retries are bounded so a degraded upstream can't hang the caller.
+
+    A read timeout is only retried for idempotent calls, the upstream may well have acted on the
+    request already (a webhook post retried then shows up twice in the channel)."""
+
+    _RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout, retries, backoff, max_backoff, rate_limits=None, pool_size=10):
+        self.timeout = timeout  # (connect, read)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(rate_limits or {})
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = Lock()
+
+    @property
+    def session(self):
+        # Built on first use, nothing to connect to before anything actually calls out
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+        return self._session
+
+    def _delay(self, attempt, headers=None):
+        retry_after = headers is not None and headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:  # Could technically be an HTTP date, just fall back to backoff
+                pass
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+    def request(self, method, url, endpoint=None, idempotent=None, **kwargs):
+        endpoint = endpoint or url
+        idempotent = method in ('GET', 'HEAD', 'PUT', 'DELETE') if idempotent is None else idempotent
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(endpoint)
+            response = None
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in self._RETRY_STATUS:
+                    return response
+                error = TransportError(f'{endpoint} returned {response.status_code}')
+            except (requests.ConnectionError, requests.Timeout) as e:  # ConnectTimeout is both
+                error = e
+                if isinstance(e, requests.ReadTimeout) and not idempotent:
+                    break
+
+            if attempt == self.retries:
+                break
+
+            delay = self._delay(attempt, response.headers if response is not None else None)
+            metrics.inc('http_retries_total', endpoint=endpoint)
+            if response is not None and response.status_code == 429:
+                self.limiter.hold(endpoint, delay)
+            print(f'{error}, retrying in {delay:.1f}s ({attempt + 1}/{self.retries})')
+            time.sleep(delay)
+
+        raise error
+
+    async def request_async(self, send, endpoint, idempotent=False):
+        """Same rate limits and retry policy as request(), for the async backend.
+
+        send is a coroutine function doing the actual request, returning (status, headers, body).
+        Returns the (status, body) of the first response that isn't retried."""
+        import aiohttp
+
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(self.limiter.reserve(endpoint))
+            status = headers = None
+
+            try:
+                status, headers, body = await send()
+                if status not in self._RETRY_STATUS:
+                    return status, body
+                error = TransportError(f'{endpoint} returned {status}')
+            except aiohttp.ClientConnectorError as e:  # Never got as far as sending the request
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:  # Might have, like a read timeout
+                error = e
+                if not idempotent:
+                    break
+
+            if attempt == self.retries:
+                break
+
+            delay = self._delay(attempt, headers)
+            metrics.inc('http_retries_total', endpoint=endpoint)
+            if status == 429:
+                self.limiter.hold(endpoint, delay)
+            print(f'{error!r}, retrying in {delay:.1f}s ({attempt + 1}/{self.retries})')
+            await asyncio.sleep(delay)
+
+        raise error
+
+    def post(self, url, endpoint=None, idempotent=False, **kwargs):
+        return self.request('POST', url, endpoint=endpoint, idempotent=idempotent, **kwargs)